@@ -0,0 +1,719 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+import os, sys, random, re, timeit, json, time, tempfile, shutil, subprocess, codecs, multiprocessing, bisect, getopt, platform
+from collections import Counter
+from termSpaceBuilder import LoadExternalLists, TokenizerProfile, NormalizerDE, BinaryTermSpace, BuildTermSpace, LanguageResources, DocumentReader, sharedResources
+from porter import PorterStemmer, StatelessPorterStemmer, STEP2_SUFFIXES, STEP3_SUFFIXES, STEP4_SUFFIXES
+
+try:
+	import resource
+except ImportError:
+	# нет в Windows: пиковый RSS в suite не замеряется
+	resource = None
+
+
+# Замеры производительности отдельных частей termSpaceBuilder
+# на синтетических данных. Запуск:
+# python benchmark.py [имя замера]
+# Без параметра выполняются все замеры по очереди.
+# Замер suite - сквозной, на синтетических корпусах en/de/ru (см. benchSuite),
+# его параметры и сохранение результата для сравнения между версиями:
+# python benchmark.py suite [--docs N] [--tokens N] [--vocabulary N] [--zipf S]
+#   [--line-tokens N] [--languages en,de,ru] [--output result.json]
+# python benchmark.py --compare old.json new.json
+
+
+# пути считаются при импорте: замеры меняют рабочий каталог (см. resourcesDir)
+BENCHMARK_SCRIPT = os.path.abspath(__file__)
+TXT_RESOURCES = os.path.join(os.path.dirname(BENCHMARK_SCRIPT), 'txt_resources')
+
+
+def syntheticLexiconDe(lemmas_num=20000, seed=49289):
+	"""
+	Синтетический лексикон в формате lexicon_dict_49289.json:
+	первые три буквы -> {лемма: [словоформы]}. Леммы собираются из слогов,
+	у каждой несколько форм с типичными немецкими окончаниями.
+	"""
+
+	rnd = random.Random(seed)
+	syllables = ["ver", "si", "che", "rung", "be", "schei", "ni", "gung", "kran", "ken", "haus", "bau", "stra", "sse", "an", "trag", "zeit", "schrift", "ar", "beit"]
+	endings = ["", "e", "en", "er", "es", "n", "s"]
+
+	lexicon = {}
+	for i in xrange(lemmas_num):
+		lemma = "".join(rnd.choice(syllables) for j in xrange(rnd.randint(2, 4)))
+		wordforms = list(set(lemma+ending for ending in endings))
+		lexicon.setdefault(lemma[:3], {})[lemma] = wordforms
+
+	return lexicon
+
+
+def syntheticCompounds(lexicon, words_num=20000, seed=1):
+	"""
+	Текст из компаундов: несколько словоформ лексикона склеиваются в одно слово,
+	иногда к началу добавляется неизвестный префикс.
+	"""
+
+	rnd = random.Random(seed)
+	wordforms = sorted(set(wordform for lemmas in lexicon.itervalues() for forms in lemmas.itervalues() for wordform in forms))
+	prefixes = ["", "", "ueber", "unter", "xyz"]
+
+	return [rnd.choice(prefixes)+"".join(rnd.choice(wordforms) for j in xrange(rnd.randint(1, 4))) for i in xrange(words_num)]
+
+
+def benchCompoundLemmatize():
+	"""
+	Сравнение поиска самого длинного известного суффикса: проверка каждого
+	суффикса по индексу словоформ против одного прохода по обращённому дереву.
+	"""
+
+	loadRes = LoadExternalLists()
+	lexicon = syntheticLexiconDe()
+	index = loadRes.indexLexiconDe(lexicon)
+	trie = loadRes.buildSuffixTrieDe(index)
+	words = syntheticCompounds(lexicon)
+	normalizer = NormalizerDE(TokenizerProfile('de'))
+
+	def probeSuffixes(word):
+		for l in range(len(word)):
+			lemma = index.get(word[l:])
+			if lemma is not None:
+				return word[:l]+lemma
+		return word
+
+	for word in words:
+		assert probeSuffixes(word) == normalizer.lemmatize(word, trie), word
+
+	probe_time = min(timeit.repeat(lambda: [probeSuffixes(word) for word in words], number=1, repeat=5))
+	trie_time = min(timeit.repeat(lambda: [normalizer.lemmatize(word, trie) for word in words], number=1, repeat=5))
+
+	print "compound lemmatize, %d words, avg length %.1f" % (len(words), sum(len(word) for word in words) / float(len(words)))
+	print "  suffix probing: %.3f s" % probe_time
+	print "  suffix trie:    %.3f s (x%.1f)" % (trie_time, probe_time / trie_time)
+
+
+def benchLineOverhead(lines_num=200000, seed=2):
+	"""
+	Накладные расходы на строку и на токен при очистке немецких токенов:
+	прежняя схема (регулярные выражения компилируются при каждом вызове,
+	умлауты заменяются циклом по словарю) против TokenizerProfile.
+	Строки короткие, чтобы были видны именно расходы на строку.
+	"""
+
+	rnd = random.Random(seed)
+	words = ["Häuser", "Straße", "grüne", "Bäume", "gibt's", "Hundehütte", "fährt", "2015", "(Versicherung)", "Übergröße", "Ärzte"]
+	lines = [" ".join(rnd.choice(words) for j in xrange(rnd.randint(1, 4))) for i in xrange(lines_num)]
+
+	profile = TokenizerProfile('de')
+	normalizer = NormalizerDE(profile)
+
+	def perCallLine(line):
+		splitchars = re.compile(profile.splitchars.pattern)
+		esc_num = re.compile(profile.esc_num.pattern)
+		terms = []
+		for token in splitchars.split(line):
+			term = token.strip(profile.punctuation).lower()
+			del_endings = re.compile(profile.del_endings.pattern)
+			term = del_endings.sub('', term)
+			if del_endings.search(term):
+				term = del_endings.sub('', term)
+			umlauts = {'ä':'ae', 'ö':'oe', 'ü':'ue', 'ß':'ss', 'д':'ae', 'ц':'oe', 'ь':'ue', 'Я':'ss', 'a\u0308':'ae', 'o\u0308':'oe', 'u\u0308':'ue'}
+			for umlaut, ersatz in umlauts.iteritems():
+				if umlaut in term:
+					term = term.replace(umlaut, ersatz)
+			if not esc_num.search(term) and len(term) > 0:
+				terms.append(term)
+		return terms
+
+	def profileLine(line):
+		return [term for term in (normalizer.normalizeUmlaut(normalizer.deleteContrs(token.strip(profile.punctuation).lower())) for token in profile.splitchars.split(line)) if not profile.esc_num.search(term) and len(term) > 0]
+
+	for line in lines[:1000]:
+		assert perCallLine(line) == profileLine(line), line
+
+	per_call_time = min(timeit.repeat(lambda: [perCallLine(line) for line in lines], number=1, repeat=3))
+	profile_time = min(timeit.repeat(lambda: [profileLine(line) for line in lines], number=1, repeat=3))
+
+	print "token cleanup, %d short lines" % len(lines)
+	print "  per-call compile: %.3f s (%.2f us/line)" % (per_call_time, per_call_time / len(lines) * 1e6)
+	print "  tokenizer profile: %.3f s (%.2f us/line, x%.1f)" % (profile_time, profile_time / len(lines) * 1e6, per_call_time / profile_time)
+
+
+def currentRss():
+	"""
+	Текущий RSS процесса в Кб по /proc (только Linux), без /proc - None.
+	"""
+
+	if not os.path.exists('/proc/self/statm'):
+		return None
+
+	with open('/proc/self/statm', 'r') as infile:
+		pages = int(infile.read().split()[1])
+
+	return pages * os.sysconf(str('SC_PAGE_SIZE')) // 1024
+
+
+def peakRss():
+	"""
+	Пиковый RSS процесса в Мб или None, если модуля resource нет (Windows).
+	"""
+
+	if resource is None:
+		return None
+
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# ru_maxrss в macOS - в байтах, в Linux - в Кб
+	if sys.platform == 'darwin':
+		return peak / 1048576.0
+
+	return peak / 1024.0
+
+
+def formatMetric(value):
+	"""
+	Значение показателя для печати, None (не замерялся) - n/a.
+	"""
+
+	if value is None:
+		return "%12s" % 'n/a'
+
+	return "%12.3f" % value
+
+
+def loadTermSpace(output_format, filename, lookups):
+	"""
+	Выполняется в отдельном процессе (см. benchTermSpaceLoad): загружает словарь,
+	ищет в нём основы lookups и печатает время и прирост RSS в Кб.
+	"""
+
+	rss_before = currentRss()
+	start = time.time()
+
+	if output_format == 'json':
+		with open(filename, 'r') as infile:
+			terms = json.load(infile)
+	else:
+		terms = BinaryTermSpace(filename)
+
+	load_time = time.time() - start
+	found = sum(1 for term in lookups if terms.get(term) is not None)
+	lookup_time = time.time() - start - load_time
+
+	rss_after = currentRss()
+
+	print load_time, lookup_time, found, rss_after - rss_before if rss_after is not None else 'None'
+
+
+def benchTermSpaceLoad(terms_num=1000000, lookups_num=1000, seed=3):
+	"""
+	Загрузка словаря основ: json.load целиком против BinaryTermSpace через mmap.
+	Каждый формат загружается в отдельном процессе, чтобы честно сравнить RSS
+	(берётся из /proc, поэтому только Linux). Ищется lookups_num основ.
+	"""
+
+	rnd = random.Random(seed)
+	letters = "abcdefghijklmnopqrstuvwxyzäöüабвгдежзиклмнопрст"
+	terms_dict = {}
+	while len(terms_dict) < terms_num:
+		terms_dict["".join(rnd.choice(letters) for j in xrange(rnd.randint(3, 14)))] = rnd.randint(1, 1000)
+	lookups = rnd.sample(sorted(terms_dict), lookups_num // 2) + ["zzzz%d" % i for i in xrange(lookups_num // 2)]
+
+	tmpdir = tempfile.mkdtemp()
+	try:
+		json_path = os.path.join(tmpdir, 'CorpusDict.json')
+		binary_path = os.path.join(tmpdir, 'CorpusDict.tsb')
+		lookups_path = os.path.join(tmpdir, 'lookups.json')
+		with open(json_path, 'w') as outfile:
+			json.dump(terms_dict, outfile)
+		BinaryTermSpace.write(binary_path, terms_dict, 12345, 'en', 'tfidf')
+		with open(lookups_path, 'w') as outfile:
+			json.dump(lookups, outfile)
+
+		print "term space load, %d stems, %d lookups" % (terms_num, lookups_num)
+		for output_format, filename in (('json', json_path), ('binary', binary_path)):
+			output = subprocess.check_output([sys.executable, BENCHMARK_SCRIPT, '--load', output_format, filename, lookups_path])
+			load_time, lookup_time, found, rss = output.split()
+			rss = "+%.1f Mb" % (int(rss) / 1024.0) if rss != 'None' else 'n/a'
+			print "  %-6s: file %.1f Mb, load %.3f s, lookups %.4f s, found %s, RSS %s" % (output_format, os.path.getsize(filename) / 1048576.0, float(load_time), float(lookup_time), found, rss)
+	finally:
+		shutil.rmtree(tmpdir)
+
+
+def syntheticEnglishWords(words_num=200000, seed=4):
+	"""
+	Слова для проверки стеммера Портера: случайные корни с одним-тремя суффиксами
+	из таблиц шагов 2-4 и окончаниями шага 1, плюс короткие случайные
+	буквосочетания (в них много y и коротких слов, на которых алгоритм ведёт
+	себя нетривиально).
+	"""
+
+	rnd = random.Random(seed)
+	roots = ["run", "hop", "fil", "agre", "conform", "gener", "relat", "sens", "electr", "hope", "formal", "ton", "analog", "bead", "feed", "sky", "fizz", "tap", "plaster", "cry"]
+	suffixes = sorted(set(suffix for table in (STEP2_SUFFIXES, STEP3_SUFFIXES, STEP4_SUFFIXES) for entries in table.itervalues() for suffix, _ in entries))
+	endings = ["", "s", "es", "ies", "sses", "ed", "eed", "ing", "ly", "y", "e", "ll"]
+	letters = "abcdeilnostuyz"
+
+	words = []
+	for i in xrange(words_num // 2):
+		words.append(rnd.choice(roots) + "".join(rnd.choice(suffixes) for j in xrange(rnd.randint(0, 2))) + rnd.choice(endings))
+	for i in xrange(words_num - len(words)):
+		words.append("".join(rnd.choice(letters) for j in xrange(rnd.randint(1, 9))))
+
+	return words
+
+
+def benchPorter():
+	"""
+	PorterStemmer (состояние в атрибутах экземпляра) против StatelessPorterStemmer
+	(состояние в локальных переменных, таблицы суффиксов) без кэша и с кэшем.
+	Перед замером проверяется, что стеммы совпадают на стоп-словах, формах
+	неправильных глаголов и существительных и синтетических словах.
+	"""
+
+	words = syntheticEnglishWords()
+	vocabulary = set(words)
+	for filename in ('stopwords_en.txt', 'verbforms.txt', 'nounforms.txt'):
+		with codecs.open(os.path.join(TXT_RESOURCES, filename), 'r', 'utf-16') as infile:
+			vocabulary.update(word.lower() for word in re.split(r'[\s,]+', infile.read()) if word.isalpha())
+
+	old_stemmer = PorterStemmer()
+	new_stemmer = StatelessPorterStemmer()
+	for word in vocabulary:
+		assert old_stemmer.stem(word, 0, len(word)-1) == new_stemmer.stem(word), word
+
+	memo_stemmer = StatelessPorterStemmer(memo_size=100000)
+	old_time = min(timeit.repeat(lambda: [old_stemmer.stem(word, 0, len(word)-1) for word in words], number=1, repeat=3))
+	new_time = min(timeit.repeat(lambda: [new_stemmer.stem(word) for word in words], number=1, repeat=3))
+	memo_time = min(timeit.repeat(lambda: [memo_stemmer.stem(word) for word in words], number=1, repeat=3))
+
+	print "porter stemmer, %d words (%d distinct), %d checked" % (len(words), len(set(words)), len(vocabulary))
+	print "  PorterStemmer:          %.3f s (%.0f words/s)" % (old_time, len(words) / old_time)
+	print "  StatelessPorterStemmer: %.3f s (%.0f words/s, x%.1f)" % (new_time, len(words) / new_time, old_time / new_time)
+	print "  with memo:              %.3f s (%.0f words/s, x%.1f)" % (memo_time, len(words) / memo_time, old_time / memo_time)
+
+
+def syntheticVocabulary(language, words_num=20000, seed=5):
+	"""
+	Словарь для синтетических текстов: стоп-слова языка в начале (они самые частые),
+	за ними слова из слогов с типичными окончаниями, для de - словоформы
+	синтетического лексикона (см. syntheticLexiconDe), так что лемматизация срабатывает,
+	для en среди них - формы неправильных глаголов и существительных из txt_resources.
+	"""
+
+	rnd = random.Random(seed)
+
+	with codecs.open(os.path.join(TXT_RESOURCES, 'stopwords_' + language + '.txt'), 'r', 'utf-16') as infile:
+		stopwords = [word for word in infile.read().split('\r\n') if word]
+
+	if language == 'de':
+		lexicon = syntheticLexiconDe()
+		wordforms = sorted(set(wordform for lemmas in lexicon.itervalues() for forms in lemmas.itervalues() for wordform in forms))
+		words = rnd.sample(wordforms, min(words_num, len(wordforms)))
+	else:
+		if language == 'ru':
+			syllables = ["про", "ка", "ни", "стол", "дом", "ра", "бо", "ви", "ле", "то", "мо", "ре", "сло", "вер"]
+			endings = ["", "а", "ы", "ов", "ами", "ый", "ая", "ого", "ть", "ет", "ют", "ёт"]
+		else:
+			syllables = ["con", "tra", "pro", "re", "ject", "walk", "run", "form", "at", "mo", "der", "na", "sen", "ti"]
+			endings = ["", "s", "ed", "ing", "ly", "tion", "ness", "er", "ies", "'s", "n't"]
+		words = list(set("".join(rnd.choice(syllables) for j in xrange(rnd.randint(1, 3))) + rnd.choice(endings) for i in xrange(words_num)))
+		if language == 'en':
+			for filename in ('verbforms.txt', 'nounforms.txt'):
+				with codecs.open(os.path.join(TXT_RESOURCES, filename), 'r', 'utf-16') as infile:
+					words.extend(line.split('\t')[0] for line in infile.read().splitlines() if '\t' in line)
+			words = list(set(words))
+		words.sort()
+		rnd.shuffle(words)
+		words = words[:words_num]
+
+	return stopwords[:100] + words
+
+
+def syntheticDocuments(language, docs_num=200, tokens_num=2000, seed=6, words_num=20000, zipf_s=1.0, line_tokens=12):
+	"""
+	Документы (списки строк) из words_num слов syntheticVocabulary с распределением Ципфа:
+	частота слова обратно пропорциональна его рангу в степени zipf_s. Часть слов
+	с заглавной буквы или с пунктуацией вокруг, изредка числа; в строке
+	в среднем line_tokens токенов.
+	"""
+
+	rnd = random.Random(seed)
+	vocabulary = syntheticVocabulary(language, words_num)
+
+	cumulative = []
+	total = 0.0
+	for rank in xrange(len(vocabulary)):
+		total += 1.0 / (rank + 1) ** zipf_s
+		cumulative.append(total)
+
+	def word():
+		token = vocabulary[min(bisect.bisect(cumulative, rnd.random() * total), len(vocabulary) - 1)]
+		chance = rnd.random()
+		if chance < 0.1:
+			return token.capitalize()
+		if chance < 0.15:
+			return token + rnd.choice([",", ".", "!", "?", ":", ";"])
+		if chance < 0.17:
+			return "(" + token + ")"
+		if chance < 0.18:
+			return str(rnd.randint(1, 3000))
+		return token
+
+	documents = []
+	for i in xrange(docs_num):
+		lines = []
+		tokens_left = tokens_num
+		while tokens_left > 0:
+			line_len = min(tokens_left, rnd.randint(max(1, line_tokens // 2), line_tokens * 3 // 2))
+			lines.append(" ".join(word() for j in xrange(line_len)) + "\n")
+			tokens_left -= line_len
+		documents.append(lines)
+
+	return documents
+
+
+def benchTokenize(docs_num=200, tokens_num=2000):
+	"""
+	Скорость обработки документов (токенов в секунду) для en, de, ru: построчный
+	путь (linesStems, как processFile) против пакетного documentStems.
+	Каждый повтор - с новым BuildTermSpace, т.е. с пустым кэшем токенов, ресурсы
+	языка общие. Перед замером проверяется, что результаты совпадают.
+	"""
+
+	tmpdir = resourcesDir()
+	cwd = os.getcwd()
+	os.chdir(tmpdir)
+	try:
+		print "tokenize, %d documents x %d tokens" % (docs_num, tokens_num)
+		for language in ('en', 'de', 'ru'):
+			documents = syntheticDocuments(language, docs_num, tokens_num)
+			BuildTermSpace(language).resources.load()
+
+			def perLine():
+				builder = BuildTermSpace(language, 'raw')
+				return [Counter(builder.linesStems(lines)) for lines in documents]
+
+			def perDocument():
+				builder = BuildTermSpace(language, 'raw')
+				return [builder.documentStems(lines) for lines in documents]
+
+			assert perLine() == perDocument(), language
+
+			tokens = docs_num * tokens_num
+			line_time = min(timeit.repeat(perLine, number=1, repeat=3))
+			document_time = min(timeit.repeat(perDocument, number=1, repeat=3))
+			print "  %s: per line %.0f tokens/s, per document %.0f tokens/s (x%.1f)" % (language, tokens / line_time, tokens / document_time, line_time / document_time)
+	finally:
+		os.chdir(cwd)
+		shutil.rmtree(tmpdir)
+
+
+# ресурсы процесса пула в startupPool
+worker_resources = None
+
+
+def initStartupWorker(mode):
+
+	global worker_resources
+
+	if mode == 'fork':
+		worker_resources = sharedResources('de')
+	elif mode == 'cache':
+		worker_resources = LanguageResources('de')
+		worker_resources.load()
+	else:
+		# как было раньше: каждый процесс разбирает json лексикона и строит дерево
+		LoadExternalLists().parseSuffixTrieDe(r'.\lexicon\lexicon_dict_49289.json')
+
+
+def startupWorkerToken(token):
+
+	if worker_resources is not None:
+		return worker_resources.normalizeToken(token)
+
+
+def startupResources(language):
+	"""
+	Выполняется в отдельном процессе (см. benchStartup): печатает время создания
+	BuildTermSpace и время обработки первого токена, при котором загружаются ресурсы.
+	"""
+
+	start = time.time()
+	builder = BuildTermSpace(language)
+	created = time.time()
+	builder.normalizeToken("Häuser")
+	loaded = time.time()
+
+	print created - start, loaded - created
+
+
+def startupPool(mode, workers):
+	"""
+	Выполняется в отдельном процессе (см. benchStartup): печатает время, за которое
+	пул из workers процессов запускается и каждый процесс получает ресурсы de.
+	mode: fork - ресурсы загружены до создания пула, json - каждый процесс разбирает
+	лексикон сам, cache - каждый процесс загружает ресурсы из кэша.
+	"""
+
+	start = time.time()
+	if mode == 'fork':
+		sharedResources('de').load()
+
+	pool = multiprocessing.Pool(workers, initStartupWorker, (mode,))
+	pool.map(startupWorkerToken, ["Häuser"] * workers, 1)
+	pool.close()
+	pool.join()
+
+	print time.time() - start
+
+
+def resourcePath(tmpdir, name):
+	"""
+	Путь в tmpdir, который termSpaceBuilder открывает как name (.\lexicon\... и т.п.).
+	В Windows это файл в подпапке, она создаётся; в остальных системах обратная
+	косая черта - часть имени файла прямо в tmpdir.
+	"""
+
+	path = os.path.join(tmpdir, name)
+	dirname = os.path.dirname(path)
+	if not os.path.isdir(dirname):
+		os.makedirs(dirname)
+
+	return path
+
+
+def resourcesDir(lemmas_num=50000):
+	"""
+	Временный рабочий каталог, в котором termSpaceBuilder находит свои ресурсы:
+	файлы txt_resources и синтетический лексикон из lemmas_num лемм под именами
+	.\lexicon\... и .\txt_resources\... (см. resourcePath). Удаляет вызывающий.
+	"""
+
+	tmpdir = tempfile.mkdtemp()
+
+	with open(resourcePath(tmpdir, r'.\lexicon\lexicon_dict_49289.json'), 'w') as outfile:
+		json.dump(syntheticLexiconDe(lemmas_num), outfile)
+	for filename in ('stopwords_en.txt', 'stopwords_de.txt', 'stopwords_ru.txt', 'verbforms.txt', 'nounforms.txt'):
+		shutil.copy(os.path.join(TXT_RESOURCES, filename), resourcePath(tmpdir, '.\\txt_resources\\' + filename))
+
+	return tmpdir
+
+
+def benchStartup(lemmas_num=50000, workers=4):
+	"""
+	Время запуска: загрузка ресурсов языка при первом токене (для de - без кэша
+	и из кэша дерева суффиксов) и готовность пула процессов с ресурсами de.
+	Каждый замер - в отдельном процессе, в рабочем каталоге с синтетическим
+	лексиконом из lemmas_num лемм и файлами txt_resources (см. resourcesDir).
+	"""
+
+	tmpdir = resourcesDir(lemmas_num)
+	try:
+		lexicon_path = resourcePath(tmpdir, r'.\lexicon\lexicon_dict_49289.json')
+
+		def child(*args):
+			output = subprocess.check_output([sys.executable, BENCHMARK_SCRIPT] + list(args), cwd=tmpdir)
+			return [float(value) for value in output.splitlines()[-1].split()]
+
+		print "startup, de lexicon %d lemmas (%.1f Mb json)" % (lemmas_num, os.path.getsize(lexicon_path) / 1048576.0)
+		for language, title in (('de', 'de, no cache'), ('de', 'de, cache'), ('ru', 'ru'), ('en', 'en')):
+			created, loaded = child('--startup', language)
+			print "  %-12s: BuildTermSpace %.3f s, first token (loading) %.3f s" % (title, created, loaded)
+
+		print "  pool of %d processes with de resources:" % workers
+		for mode in ('json', 'cache', 'fork'):
+			print "    %-5s: %.3f s" % (mode, child('--startup-pool', mode, str(workers))[0])
+	finally:
+		shutil.rmtree(tmpdir)
+
+
+def writeCorpus(dirname, documents):
+	"""
+	Записывает документы (см. syntheticDocuments) в dirname файлами doc00000.txt... в utf-8.
+	"""
+
+	os.makedirs(dirname)
+	for i, lines in enumerate(documents):
+		with codecs.open(os.path.join(dirname, 'doc%05d.txt' % i), 'w', 'utf-8') as outfile:
+			outfile.writelines(lines)
+
+
+def suiteRun(language, corpus_dir, repeat=3):
+	"""
+	Выполняется в отдельном процессе (см. benchSuite), печатает результаты json:
+	время создания BuildTermSpace с загрузкой ресурсов (для de - с построением
+	кэша дерева суффиксов, рабочий каталог каждый раз новый), скорость processString
+	по всем строкам корпуса (строки прочитаны заранее), processFile по всем файлам
+	и crawl корпуса целиком (raw, с записью результата), пиковый RSS процесса.
+	processString и processFile - лучший из repeat повторов, каждый с новым
+	BuildTermSpace, т.е. с пустым кэшем токенов.
+	"""
+
+	start = time.time()
+	builder = BuildTermSpace(language, 'raw')
+	builder.resources.load()
+	startup = time.time() - start
+
+	filenames = sorted(os.path.join(corpus_dir, filename) for filename in os.listdir(corpus_dir))
+	reader = DocumentReader()
+	lines = [line for filename in filenames for line in reader.iterLines(filename)]
+	bytes_num = sum(os.path.getsize(filename) for filename in filenames)
+	tokens_num = sum(1 for line in lines for token in builder.profile.splitchars.split(line) if token)
+
+	def processStrings():
+		builder = BuildTermSpace(language, 'raw')
+		for line in lines:
+			for term in builder.processString(line):
+				pass
+
+	def processFiles():
+		builder = BuildTermSpace(language, 'raw')
+		for filename in filenames:
+			builder.processFile(filename)
+
+	string_time = min(timeit.repeat(processStrings, number=1, repeat=repeat))
+	file_time = min(timeit.repeat(processFiles, number=1, repeat=repeat))
+
+	output_dir = tempfile.mkdtemp()
+	stdout = sys.stdout
+	try:
+		# crawl печатает имена файлов, а stdout этого процесса - результат
+		sys.stdout = open(os.devnull, 'w')
+		start = time.time()
+		BuildTermSpace(language, 'raw', output_dir=output_dir).crawl(corpus_dir)
+		crawl_time = time.time() - start
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+		shutil.rmtree(output_dir)
+
+	print json.dumps({
+		'files': len(filenames), 'bytes': bytes_num, 'tokens': tokens_num,
+		'startup_seconds': startup,
+		'process_string_tokens_per_sec': tokens_num / string_time,
+		'process_file_tokens_per_sec': tokens_num / file_time,
+		'crawl_seconds': crawl_time,
+		'crawl_tokens_per_sec': tokens_num / crawl_time,
+		'crawl_bytes_per_sec': bytes_num / crawl_time,
+		'peak_rss_mb': peakRss()}, sort_keys=True)
+
+
+# показатели suite: ключ в результатах, подпись, больше - лучше
+SUITE_METRICS = [('startup_seconds', 'startup, s', False), ('process_string_tokens_per_sec', 'processString, tokens/s', True), ('process_file_tokens_per_sec', 'processFile, tokens/s', True), ('crawl_tokens_per_sec', 'crawl, tokens/s', True), ('crawl_bytes_per_sec', 'crawl, bytes/s', True), ('peak_rss_mb', 'peak RSS, Mb', False)]
+
+
+def benchSuite(docs_num=300, tokens_num=2000, words_num=20000, zipf_s=1.0, line_tokens=12, languages=('en', 'de', 'ru'), output=None):
+	"""
+	Сквозной замер для сравнения версий: для каждого языка синтетический корпус
+	(docs_num документов по tokens_num токенов, см. syntheticDocuments) пишется
+	на диск и обрабатывается в отдельном процессе (см. suiteRun), так что
+	время запуска и пиковый RSS не зависят от других замеров. Корпуса
+	детерминированы: при тех же параметрах они одинаковы в любой версии.
+	Результат с параметрами, версией python и коммитом git сохраняется в output
+	(json), два таких файла сравнивает compareSuite.
+	"""
+
+	config = {'docs': docs_num, 'tokens': tokens_num, 'vocabulary': words_num, 'zipf': zipf_s, 'line_tokens': line_tokens}
+
+	try:
+		commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(BENCHMARK_SCRIPT), stderr=open(os.devnull, 'w')).strip()
+	except (OSError, subprocess.CalledProcessError):
+		commit = None
+
+	results = {}
+	tmpdir = resourcesDir()
+	try:
+		print "suite, %(docs)d documents x %(tokens)d tokens, vocabulary %(vocabulary)d, zipf %(zipf)s, %(line_tokens)d tokens per line" % config
+		for language in languages:
+			corpus_dir = os.path.join(tmpdir, 'corpus_' + language)
+			writeCorpus(corpus_dir, syntheticDocuments(language, docs_num, tokens_num, words_num=words_num, zipf_s=zipf_s, line_tokens=line_tokens))
+			output_lines = subprocess.check_output([sys.executable, BENCHMARK_SCRIPT, '--suite-run', language, corpus_dir], cwd=tmpdir)
+			results[language] = json.loads(output_lines.splitlines()[-1])
+			print "  %s: %.1f Mb, %d tokens" % (language, results[language]['bytes'] / 1048576.0, results[language]['tokens'])
+			for key, title, higher in SUITE_METRICS:
+				print "    %-25s %s" % (title, formatMetric(results[language][key]))
+	finally:
+		shutil.rmtree(tmpdir)
+
+	if output is not None:
+		with open(output, 'w') as outfile:
+			json.dump({'config': config, 'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(), 'results': results}, outfile, sort_keys=True, indent=1)
+
+	return results
+
+
+def compareSuite(old_path, new_path):
+	"""
+	Сравнение двух результатов benchSuite: для каждого языка и показателя
+	старое и новое значение и их отношение (> 1 - новая версия лучше).
+	"""
+
+	with open(old_path, 'r') as infile:
+		old = json.load(infile)
+	with open(new_path, 'r') as infile:
+		new = json.load(infile)
+
+	if old['config'] != new['config']:
+		print "warning: different suite parameters", old['config'], new['config']
+
+	print "suite, %s -> %s" % (old.get('commit'), new.get('commit'))
+	for language in sorted(set(old['results']) & set(new['results'])):
+		print "  %s:" % language
+		for key, title, higher in SUITE_METRICS:
+			old_value = old['results'][language][key]
+			new_value = new['results'][language][key]
+			if old_value is None or new_value is None:
+				print "    %-25s %s %s" % (title, formatMetric(old_value), formatMetric(new_value))
+				continue
+			ratio = new_value / old_value if higher else old_value / new_value
+			print "    %-25s %s %s  x%.2f%s" % (title, formatMetric(old_value), formatMetric(new_value), ratio, '  <-- slower' if ratio < 0.9 else '')
+
+
+BENCHMARKS = [('lemmatize', benchCompoundLemmatize), ('lines', benchLineOverhead), ('load', benchTermSpaceLoad), ('porter', benchPorter), ('startup', benchStartup), ('suite', benchSuite), ('tokenize', benchTokenize)]
+
+
+def main():
+
+	if sys.argv[1:2] == ['--load']:
+		with open(sys.argv[4], 'r') as infile:
+			loadTermSpace(sys.argv[2], sys.argv[3], json.load(infile))
+		return
+
+	if sys.argv[1:2] == ['--startup']:
+		startupResources(sys.argv[2])
+		return
+
+	if sys.argv[1:2] == ['--startup-pool']:
+		startupPool(sys.argv[2], int(sys.argv[3]))
+		return
+
+	if sys.argv[1:2] == ['--suite-run']:
+		suiteRun(sys.argv[2], sys.argv[3])
+		return
+
+	if sys.argv[1:2] == ['--compare']:
+		compareSuite(sys.argv[2], sys.argv[3])
+		return
+
+	opts, names = getopt.gnu_getopt(sys.argv[1:], '', ['docs=', 'tokens=', 'vocabulary=', 'zipf=', 'line-tokens=', 'languages=', 'output='])
+	options = dict(opts)
+	suite_args = {
+		'docs_num': int(options.get('--docs', 300)),
+		'tokens_num': int(options.get('--tokens', 2000)),
+		'words_num': int(options.get('--vocabulary', 20000)),
+		'zipf_s': float(options.get('--zipf', 1.0)),
+		'line_tokens': int(options.get('--line-tokens', 12)),
+		'languages': options.get('--languages', 'en,de,ru').split(','),
+		'output': options.get('--output')}
+
+	for name, bench in BENCHMARKS:
+		if not names or name in names:
+			if name == 'suite':
+				bench(**suite_args)
+			else:
+				bench()
+
+
+if __name__ == '__main__':
+	main()
@@ -1,20 +1,42 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
-import os, sys
+import os, sys, math
 from os.path import join
-from collections import defaultdict
+from collections import defaultdict, Counter, OrderedDict, deque
 from nltk.stem.snowball import RussianStemmer
 from nltk.stem.snowball import GermanStemmer
-from porter import PorterStemmer
-import codecs, re, json
+from porter import StatelessPorterStemmer
+import codecs, re, json, mmap, struct
+import getopt, multiprocessing, hashlib, threading, gc, cPickle, heapq, tempfile, shutil, functools, timeit
 import pymorphy2
+from array import array
+from multiprocessing.pool import ThreadPool
+
+try:
+	# os.walk в python 2 делает stat для каждого элемента папки, scandir.walk
+	# берёт тип из самого списка папки, на сетевых дисках это заметно быстрее
+	from scandir import walk
+except ImportError:
+	# в python 3.5+ os.walk сам работает через os.scandir
+	from os import walk
+
+try:
+	import numpy
+except ImportError:
+	# нужен только для TfidfVectorizer и ApproxTermCounter
+	numpy = None
 
 
 # Скрипт для составления словаря основ слов с частотой их встречаемости
 # по документам корпусов. В зависимости от переданного параметра 
 # выходной json можно использовать: 1) tfidf - для реализации подсчета
-# tf-idf, 2) raw - для подсчёта абсолютной частоты основы по всем документам.
+# tf-idf, 2) raw - для подсчёта абсолютной частоты основы по всем документам,
+# 3) approx - приближённое число документов только для самых частых основ,
+# 4) tfdf - частота основы и число документов с ней за один проход.
+# С --ngrams N вместо основ считаются n-граммы основ до длины N (см. crawlNgrams).
+# С --format shard результат сохраняется шардом, шарды частей корпуса, собранные
+# отдельно, объединяются командой merge (см. BuildTermSpace.mergeShards).
 # Словарь содержит основу и указатель в скольки документах
 # корпуса основа встретилась (или абсолютную частоту). 
 # {"football":2} означает, что основа football встретилась в двух документах из всего корпуса.
@@ -23,11 +45,44 @@ import pymorphy2
 # Класс LoadExternalLists загружает вспомогательные файлы,
 # класс NormalizerDE - лемматизация немецких текстов,
 # класс NormalizerRU - только функция преобразования ё в е,
-# класс NormalizerEN - функции обработки слова на английском.
+# класс NormalizerEN - функции обработки слова на английском,
+# класс LanguageResources - неизменяемые ресурсы языка, общие для нескольких потоков,
+# класс DocumentReader - чтение документов корпуса,
+# класс PipelineStats - замеры этапов обработки для профилирования,
+# класс TermSpaceAccumulator - подсчёт частот основ по документам,
+# класс TermSpaceShards - слияние шардов,
+# класс ApproxTermCounter - приближённый подсчёт в постоянной памяти (нужен numpy),
+# класс BinaryTermSpace - двоичный формат результата с поиском через mmap,
+# класс TfidfVectorizer - векторы tf-idf документов по готовому словарю (нужен numpy).
 # Для работы требует наличие модуля Porter Stemmer,
 # pymorphy2 и nltk.
 
 
+# Первые три буквы слов немецкого лексикона, т.е. ключи первого уровня
+# lexicon_dict_49289.json. Словоформы, у которых начало не совпадает
+# с ключом своего подсловаря, при поиске никогда не находятся.
+ALPHABET_DE = frozenset(["aac", "aal", "aas", "aba", "abb", "abc", "abd", "abe", "abf", "abg", "abh", "abi", "abj", "abk", "abl", "abm", "abn", "abo", "abp", "abq", "abr", "abs", "abt", "abu", "abv", "abw", "abz", "acc", "ach", "ack", "act", "ada", "add", "ade", "adh", "adj", "adl", "adm", "ado", "adr", "ads", "adv", "aeb", "aec", "aed", "aef", "aeg", "aeh", "ael", "aem", "aen", "aep", "aeq", "aer", "aes", "aet", "aeu", "aex", "aff", "afg", "afr", "aft", "aga", "age", "agg", "agi", "ago", "agr", "ags", "ahl", "ahm", "ahn", "aho", "air", "aka", "akk", "akn", "ako", "akq", "akr", "akt", "aku", "akw", "akz", "ala", "alb", "alc", "ale", "alf", "alg", "ali", "alk", "all", "alm", "alp", "alr", "als", "alt", "alu", "alz", "ama", "amb", "ame", "amh", "ami", "amm", "amn", "amo", "amp", "ams", "amt", "amu", "ana", "anb", "and", "ane", "anf", "ang", "anh", "ani", "anj", "ank", "anl", "anm", "ann", "ano", "anp", "anq", "anr", "ans", "ant", "anv", "anw", "anz", "aor", "apa", "ape", "apf", "aph", "apo", "app", "apr", "aps", "aqu", "ara", "arb", "arc", "ard", "are", "arg", "arh", "ari", "ark", "arm", "arn", "aro", "arr", "ars", "art", "arz", "asb", "asc", "ase", "asi", "ask", "aso", "asp", "ass", "ast", "asy", "asz", "ate", "ath", "atl", "atm", "ato", "atr", "att", "atu", "aub", "aud", "aue", "auf", "aug", "auh", "auk", "aul", "aup", "aur", "aus", "aut", "ava", "ave", "avi", "axe", "axi", "aza", "aze", "azt", "azu", "bab", "bac", "bad", "bae", "baf", "bag", "bah", "bai", "baj", "bak", "bal", "bam", "ban", "bap", "bar", "bas", "bat", "bau", "bay", "baz", "bea", "beb", "bec", "bed", "bee", "bef", "beg", "beh", "bei", "bej", "bek", "bel", "bem", "ben", "beo", "bep", "beq", "ber", "bes", "bet", "beu", "bev", "bew", "bez", "bia", "bib", "bie", "big", "bik", "bil", "bim", "bin", "bio", "bir", "bis", "bit", "biw", "biz", "bjo", "bla", "ble", "bli", "blo", "blu", "bmw", "boa", "bob", "boc", "bod", "boe", "bog", "boh", "boi", "boj", "bol", "bom", "bon", "boo", "bor", "bos", "bot", "bou", "bow", "box", "boy", "bra", "bre", "bri", "bro", "bru", "bub", "buc", "bud", "bue", "buf", "bug", "buh", "buk", "bul", "bum", "bun", "bur", "bus", "but", "byt", "byz", "cac", "cad", "cae", "caf", "cag", "cal", "cam", "can", "cap", "car", "cas", "cd-", "cds", "cea", "cel", "cem", "cen", "ceo", "cer", "ces", "cey", "cha", "che", "chi", "chl", "cho", "chr", "cie", "cin", "cit", "cla", "cle", "cli", "clo", "clu", "coa", "coc", "cod", "coh", "coi", "cok", "col", "com", "con", "coo", "cop", "cor", "cou", "cov", "cow", "coy", "cpu", "cra", "cre", "cro", "cto", "cup", "cur", "cut", "cya", "cyb", "cyr", "dab", "dac", "dad", "dae", "daf", "dag", "dah", "dai", "dak", "dal", "dam", "dan", "dar", "das", "dat", "dau", "dav", "daw", "daz", "dea", "deb", "dec", "ded", "dee", "def", "deg", "deh", "dei", "dej", "dek", "del", "dem", "den", "deo", "dep", "der", "des", "det", "deu", "dev", "dez", "di.", "dia", "dic", "did", "die", "dif", "dig", "dik", "dil", "dim", "din", "dio", "dip", "dir", "dis", "dit", "div", "diw", "djs", "do.", "doc", "dod", "doe", "dog", "doh", "dok", "dol", "dom", "don", "doo", "dop", "dor", "dos", "dot", "dou", "dow", "doz", "dra", "dre", "dri", "dro", "dru", "dsc", "dtu", "dua", "dub", "duc", "dud", "due", "duf", "dui", "dul", "dum", "dun", "duo", "dup", "dur", "dus", "dut", "duz", "dvd", "dyn", "dys", "ebb", "ebe", "ebn", "ech", "eck", "ecu", "edb", "edd", "ede", "edg", "edi", "edl", "edm", "edu", "efe", "eff", "ega", "ege", "egg", "ego", "ehe", "ehr", "eib", "eic", "eid", "eie", "eif", "eig", "eil", "eim", "ein", "eis", "eit", "eiw", "eiz", "eja", "eje", "eke", "ekl", "eks", "ekz", "ela", "elc", "eld", "ele", "elf", "eli", "elk", "ell", "elm", "elo", "els", "elt", "ema", "emb", "eme", "emi", "emm", "emo", "emp", "ems", "emu", "enc", "end", "ene", "enf", "eng", "enk", "eno", "ens", "ent", "enu", "enz", "epe", "epi", "epo", "epp", "eps", "equ", "era", "erb", "erc", "erd", "ere", "erf", "erg", "erh", "eri", "erj", "erk", "erl", "erm", "ern", "ero", "erp", "erq", "err", "ers", "ert", "eru", "erw", "erz", "esc", "ese", "esk", "eso", "esp", "ess", "est", "eta", "eth", "eti", "etu", "etw", "ety", "euc", "eug", "eul", "eun", "eup", "eur", "eut", "eva", "eve", "evi", "evo", "ewi", "exa", "exc", "exe", "exh", "exi", "exk", "exm", "exn", "exo", "exp", "exq", "exs", "ext", "exz", "eyl", "fab", "fac", "fad", "fae", "fag", "fah", "fai", "fak", "fal", "fam", "fan", "far", "fas", "fat", "fau", "fav", "fax", "faz", "fea", "feb", "fec", "fed", "fee", "feg", "feh", "fei", "fel", "fem", "fen", "fer", "fes", "fet", "feu", "fez", "fia", "fib", "fic", "fid", "fie", "fig", "fik", "fil", "fim", "fin", "fir", "fis", "fit", "fix", "fjo", "fla", "fle", "fli", "flo", "flu", "fly", "foc", "foe", "foh", "fok", "fol", "fon", "fop", "for", "fos", "fot", "fou", "foy", "fr.", "fra", "fre", "fri", "fro", "fru", "fuc", "fue", "fuf", "fug", "fuh", "ful", "fum", "fun", "fur", "fus", "fut", "g'f", "g'm", "g'n", "g'r", "g's", "g'w", "gab", "gad", "gae", "gaf", "gag", "gal", "gam", "gan", "gar", "gas", "gat", "gau", "gaz", "gbs", "gby", "gea", "geb", "gec", "ged", "gee", "gef", "geg", "geh", "gei", "gej", "gek", "gel", "gem", "gen", "geo", "gep", "geq", "ger", "ges", "get", "geu", "gev", "gew", "gez", "gha", "ghe", "ghu", "gib", "gie", "gif", "gig", "gil", "gim", "gin", "gip", "gir", "gis", "git", "giu", "gla", "gle", "gli", "glo", "glu", "gly", "gmb", "gna", "gne", "gno", "gnu", "gob", "goc", "god", "goe", "gog", "gol", "gom", "gon", "gor", "gos", "got", "gou", "gra", "gre", "gri", "gro", "gru", "gua", "guc", "gud", "gue", "gui", "gul", "gum", "gun", "gur", "gus", "gut", "gym", "gyn", "gys", "g‘f", "g‘m", "g‘n", "g‘r", "g‘s", "g‘w", "g’f", "g’m", "g’n", "g’r", "g’s", "g’w", "haa", "hab", "hac", "had", "hae", "haf", "hag", "hah", "hai", "hak", "hal", "ham", "han", "hap", "har", "has", "hat", "hau", "hav", "haw", "hax", "hay", "haz", "hea", "heb", "hec", "hed", "hee", "hef", "heg", "heh", "hei", "hek", "hel", "hem", "hen", "her", "hes", "het", "heu", "hex", "hey", "hic", "hie", "hig", "hil", "him", "hin", "hip", "hir", "his", "hit", "hiw", "hob", "hoc", "hod", "hoe", "hof", "hoh", "hok", "hol", "hom", "hon", "hoo", "hop", "hor", "hos", "hot", "hou", "hoy", "hub", "huc", "hue", "huf", "hug", "huh", "hul", "hum", "hun", "hup", "hur", "hus", "hut", "hya", "hyb", "hyd", "hye", "hyg", "hym", "hyp", "hys", "ibm", "ibr", "ico", "ics", "ide", "idi", "ido", "idy", "ige", "igl", "ign", "igo", "ike", "iko", "ilb", "ill", "ils", "ilt", "ima", "imb", "imi", "imk", "imm", "imp", "ina", "inb", "inc", "ind", "ine", "inf", "ing", "inh", "ini", "inj", "ink", "inl", "inn", "ino", "inq", "ins", "int", "inv", "inw", "inz", "iod", "ion", "iqs", "ira", "ird", "ire", "iri", "irl", "irm", "iro", "irr", "isa", "ise", "isl", "ism", "iso", "isr", "iss", "ist", "ita", "ite", "iva", "iza", "ize", "jac", "jae", "jag", "jah", "jak", "jal", "jam", "jan", "jap", "jar", "jas", "jau", "jaw", "jaz", "jea", "jec", "jed", "jee", "jel", "jen", "jer", "jes", "jet", "jew", "jim", "jin", "joa", "job", "joc", "jod", "joe", "jog", "joh", "joi", "jok", "jol", "jon", "jop", "jor", "jos", "jot", "jou", "jov", "jua", "jub", "juc", "jud", "jue", "jug", "jul", "jum", "jun", "jup", "jur", "jus", "jut", "juw", "jux", "jva", "kab", "kac", "kad", "kae", "kaf", "kah", "kai", "kaj", "kak", "kal", "kam", "kan", "kap", "kar", "kas", "kat", "kau", "kav", "kbi", "kbs", "kby", "keb", "kec", "kee", "kef", "keg", "keh", "kei", "kek", "kel", "kem", "ken", "ker", "kes", "ket", "keu", "kev", "kha", "kib", "kic", "kid", "kie", "kif", "kil", "kim", "kin", "kio", "kip", "kir", "kis", "kit", "kiw", "kla", "kle", "kli", "klo", "klu", "kna", "kne", "kni", "kno", "knu", "koa", "kob", "koc", "kod", "koe", "kof", "kog", "koh", "koi", "koj", "kok", "kol", "kom", "kon", "koo", "kop", "kor", "kos", "kot", "kra", "kre", "kri", "kro", "kru", "kry", "kub", "kuc", "kue", "kuf", "kug", "kuh", "kul", "kum", "kun", "kup", "kur", "kus", "kut", "kuv", "kuw", "kyb", "kyr", "kzs", "lab", "lac", "lad", "lae", "laf", "lag", "lah", "lai", "lak", "lal", "lam", "lan", "lap", "laq", "lar", "las", "lat", "lau", "lav", "law", "lax", "lay", "laz", "lea", "leb", "lec", "led", "lee", "leg", "leh", "lei", "lek", "lem", "len", "leo", "ler", "les", "let", "leu", "lev", "lex", "lia", "lib", "lic", "lid", "lie", "lif", "lig", "lii", "lik", "lil", "lim", "lin", "lip", "liq", "lis", "lit", "liv", "liz", "lkw", "lob", "loc", "lod", "loe", "lof", "log", "loh", "loi", "lok", "lol", "lom", "lon", "loo", "lor", "los", "lot", "lov", "loy", "lps", "luc", "lud", "lue", "luf", "lug", "luk", "lul", "lum", "lun", "lup", "lur", "lus", "lut", "lux", "luz", "lyk", "lym", "lyn", "lyr", "lys", "maa", "mac", "mad", "mae", "maf", "mag", "mah", "mai", "maj", "mak", "mal", "mam", "man", "map", "mar", "mas", "mat", "mau", "max", "may", "maz", "mbi", "mbs", "mby", "mec", "med", "mee", "meg", "meh", "mei", "mek", "mel", "mem", "men", "mep", "mer", "mes", "met", "meu", "mex", "mey", "mez", "mi.", "mia", "mic", "mie", "mig", "mih", "mik", "mil", "mim", "min", "mir", "mis", "mit", "mix", "mne", "mo.", "mob", "moc", "mod", "moe", "mof", "mog", "moh", "mok", "mol", "mom", "mon", "moo", "mop", "mor", "mos", "mot", "mou", "mov", "moz", "mp3", "mps", "muc", "mue", "muf", "mul", "mum", "mun", "mur", "mus", "mut", "myr", "mys", "myt", "nab", "nac", "nad", "nae", "nag", "nah", "nai", "nam", "nan", "nap", "nar", "nas", "nat", "nau", "nav", "naz", "nea", "neb", "nec", "nef", "neg", "neh", "nei", "nek", "nel", "nen", "neo", "nep", "ner", "nes", "net", "neu", "new", "nib", "nic", "nid", "nie", "nig", "nih", "nik", "nil", "nim", "nip", "nir", "nis", "nit", "niv", "nix", "niz", "nob", "noc", "noe", "nom", "non", "nop", "nor", "nos", "not", "nou", "nov", "now", "nua", "nud", "nue", "nuk", "nul", "num", "nus", "nut", "nva", "nyl", "nym", "oas", "obd", "obe", "obg", "obi", "obj", "obl", "obm", "obo", "obr", "obs", "obt", "obu", "obz", "och", "ock", "ode", "odi", "odo", "ody", "oed", "oef", "oeh", "oek", "oel", "oen", "oer", "oes", "ofe", "off", "ohn", "ohr", "okk", "okt", "oku", "okz", "ola", "old", "ole", "olf", "olg", "oli", "oll", "oly", "oma", "ome", "omi", "omn", "ona", "onk", "ont", "ony", "opa", "ope", "opf", "opi", "opo", "opp", "opt", "opu", "ora", "orb", "orc", "ord", "org", "ori", "ork", "orl", "orn", "ort", "osc", "osk", "osl", "osm", "osn", "osr", "oss", "ost", "osz", "oto", "ott", "out", "ouv", "ouz", "ova", "ove", "ovu", "owe", "oxi", "oxy", "oze", "ozo", "paa", "pac", "pad", "pae", "paf", "pag", "pak", "pal", "pam", "pan", "pap", "par", "pas", "pat", "pau", "pav", "paz", "pcs", "pda", "pec", "ped", "peg", "pei", "pej", "pek", "pel", "pen", "pep", "per", "pes", "pet", "pfa", "pfe", "pfi", "pfl", "pfo", "pfr", "pfu", "pha", "phe", "phi", "phl", "pho", "phr", "phy", "pia", "pic", "pie", "pig", "pik", "pil", "pim", "pin", "pio", "pip", "pir", "pis", "pit", "pix", "piz", "pkw", "pla", "ple", "pli", "plo", "plu", "pne", "poc", "pod", "poe", "pog", "poh", "poi", "pok", "pol", "pom", "pon", "poo", "pop", "por", "pos", "pot", "pow", "pra", "pre", "pri", "pro", "prs", "pru", "psa", "psc", "pse", "psy", "pub", "puc", "pud", "pue", "puf", "pul", "pum", "pun", "pup", "pur", "pus", "put", "puz", "pvc", "pyg", "pyj", "pyr", "pyt", "qua", "que", "qui", "quo", "rab", "rac", "rad", "rae", "raf", "rag", "rah", "rai", "rak", "ral", "ram", "ran", "rap", "rar", "ras", "rat", "rau", "rav", "raz", "rea", "reb", "rec", "red", "ree", "ref", "reg", "reh", "rei", "rej", "rek", "rel", "rem", "ren", "reo", "rep", "req", "res", "ret", "reu", "rev", "rex", "rez", "rha", "rhe", "rhi", "rho", "rhy", "rib", "ric", "rie", "rif", "rig", "rik", "ril", "rin", "rio", "rip", "ris", "rit", "riv", "riz", "roa", "rob", "roc", "rod", "roe", "rog", "roh", "rok", "rol", "rom", "ron", "ros", "rot", "rou", "row", "roy", "rtl", "rua", "rub", "ruc", "rud", "rue", "ruf", "ruh", "rui", "rum", "run", "rup", "rus", "rut", "rws", "ryb", "sa.", "saa", "sab", "sac", "sad", "sae", "saf", "sag", "sah", "sai", "sak", "sal", "sam", "san", "sap", "sar", "sas", "sat", "sau", "sav", "sax", "sca", "sce", "sch", "sci", "scr", "sea", "seb", "sec", "sed", "see", "seg", "seh", "sei", "sek", "sel", "sem", "sen", "seo", "sep", "seq", "ser", "ses", "set", "seu", "sex", "sez", "sha", "she", "shi", "sho", "shr", "shu", "sia", "sib", "sic", "sid", "sie", "sig", "sik", "sil", "sim", "sin", "sip", "sir", "sis", "sit", "ska", "ske", "ski", "skl", "sko", "skr", "sku", "sky", "sla", "sli", "slo", "slu", "sma", "smo", "sna", "sni", "sno", "so.", "soa", "soc", "sod", "soe", "sof", "sog", "soh", "soj", "sol", "som", "son", "sop", "sor", "sos", "sot", "sou", "sow", "soz", "spa", "spe", "sph", "spi", "spl", "spo", "spr", "spu", "squ", "sta", "ste", "sti", "sto", "str", "stu", "sty", "sub", "suc", "sud", "sue", "suf", "sug", "suh", "sui", "suj", "suk", "sul", "sum", "sup", "sur", "sus", "sut", "sve", "swe", "swi", "syl", "sym", "syn", "syr", "sys", "sze", "tab", "tac", "tad", "tae", "taf", "tag", "tai", "tak", "tal", "tam", "tan", "tao", "tap", "tar", "tas", "tat", "tau", "tav", "tax", "tay", "tby", "tea", "tec", "ted", "tee", "teg", "teh", "tei", "tek", "tel", "tem", "ten", "tep", "ter", "tes", "teu", "tex", "tha", "the", "thi", "tho", "thr", "thu", "thy", "tib", "tic", "tid", "tie", "tig", "til", "tim", "tin", "tip", "tir", "tis", "tit", "toa", "tob", "toc", "tod", "toe", "toh", "toi", "tok", "tol", "tom", "ton", "too", "top", "tor", "tos", "tot", "tou", "tox", "toy", "tra", "tre", "tri", "tro", "tru", "tsa", "tsc", "tse", "tub", "tuc", "tue", "tug", "tul", "tum", "tun", "tup", "tur", "tus", "tut", "tvs", "twi", "tyc", "typ", "tyr", "udo", "ueb", "uel", "uep", "uer", "ufe", "uff", "ufr", "uhr", "uhu", "ukr", "uku", "ulf", "uli", "ulk", "ulm", "ulr", "ult", "uma", "umb", "umc", "umd", "ume", "umf", "umg", "umh", "umi", "umj", "umk", "uml", "umm", "umn", "umo", "ump", "umq", "umr", "ums", "umt", "umv", "umw", "umz", "una", "unb", "unc", "und", "une", "unf", "ung", "unh", "uni", "unk", "unl", "unm", "unn", "uno", "unp", "unq", "unr", "uns", "unt", "unu", "unv", "unw", "unz", "upd", "upg", "ura", "urb", "urd", "ure", "urf", "urg", "urh", "uri", "urk", "url", "urm", "urn", "uro", "urp", "urs", "urt", "uru", "urv", "urw", "urz", "usa", "usb", "use", "usi", "usu", "uta", "ute", "uti", "uto", "uwe", "uze", "vae", "vag", "vak", "val", "vam", "van", "var", "vas", "vat", "veg", "veh", "vei", "vek", "ven", "ver", "ves", "vet", "via", "vib", "vic", "vid", "vie", "vik", "vil", "vio", "vip", "vir", "vis", "vit", "viz", "vla", "voe", "vog", "voi", "vok", "vol", "von", "vor", "vos", "vot", "voy", "vul", "vws", "waa", "wab", "wac", "wad", "wae", "waf", "wag", "wah", "wai", "wal", "wam", "wan", "wap", "war", "was", "wat", "way", "wcs", "web", "wec", "wed", "weg", "weh", "wei", "wel", "wen", "wer", "wes", "wet", "wgs", "whi", "wic", "wid", "wie", "wik", "wil", "wim", "win", "wip", "wir", "wis", "wit", "wla", "wms", "wob", "woc", "wod", "woe", "wog", "woh", "wok", "wol", "won", "wor", "wra", "wri", "wuc", "wue", "wul", "wun", "wup", "wur", "wus", "wut", "wyn", "x-b", "xan", "xeo", "xyl", "yac", "yan", "yeb", "yen", "yet", "yog", "yor", "yuc", "yup", "yvo", "zac", "zae", "zag", "zah", "zan", "zap", "zar", "zas", "zau", "zeb", "zec", "zed", "zeh", "zei", "zel", "zem", "zen", "zep", "zer", "zet", "zeu", "zic", "zie", "zif", "zig", "zik", "zim", "zin", "zio", "zip", "zir", "zis", "zit", "ziv", "zlo", "zob", "zoc", "zoe", "zof", "zog", "zol", "zom", "zon", "zoo", "zop", "zor", "zot", "zua", "zub", "zuc", "zud", "zue", "zuf", "zug", "zuh", "zui", "zuj", "zuk", "zul", "zum", "zun", "zuo", "zup", "zuq", "zur", "zus", "zut", "zuv", "zuw", "zuz", "zwa", "zwe", "zwi", "zwo", "zya", "zyk", "zyl", "zyn", "zyp", "zys"])
+
+
+# Версия формата кэша ресурсов (см. LoadExternalLists.loadCached): увеличивается,
+# когда меняется то, что строится по исходному файлу, чтобы старый кэш не использовался.
+RESOURCE_CACHE_VERSION = 1
+
+# Для tfdf частота основы и число документов с ней хранятся одним целым:
+# (частота << TFDF_DOCS_BITS) + число документов (см. unpackTfDf). Такие числа
+# складываются как обычные счётчики, а по убыванию они упорядочены по частоте,
+# затем по числу документов.
+TFDF_DOCS_BITS = 32
+
+# Версия обработки токенов, записывается в шарды (см. BuildTermSpace.writeShard):
+# увеличивается, когда меняется то, какие основы получаются из текста,
+# чтобы не сливались шарды, собранные разными версиями.
+PIPELINE_VERSION = 1
+
+# Версия формата файла шарда.
+SHARD_FORMAT_VERSION = 1
+
+
 class LoadExternalLists(object):
     
     """
@@ -45,30 +100,32 @@ class LoadExternalLists(object):
         self.nountransforms = {}
 
         self.lexicon_de = {}
+        self.lexicon_index_de = {}
+        self.suffix_trie_de = {}
         
         
     def loadStopWordsEN(self):
 
         with codecs.open(r".\txt_resources\stopwords_en.txt",'r','utf-16') as file_openstopw:
-        	self.stopwords = set(file_openstopw.read().split('\r\n'))
+        	self.stopwords_en = set(file_openstopw.read().split('\r\n'))
 
-        return self.stopwords
+        return self.stopwords_en
 
 
     def loadStopWordsDE(self):
 
         with codecs.open(r".\txt_resources\stopwords_de.txt",'r','utf-16') as file_openstopw:
-        	self.stopwords = set(file_openstopw.read().split('\r\n'))
+        	self.stopwords_de = set(file_openstopw.read().split('\r\n'))
 
-        return self.stopwords
+        return self.stopwords_de
 
 
     def loadStopWordsRU(self):
 
         with codecs.open(r".\txt_resources\stopwords_ru.txt",'r','utf-16') as file_openstopw:
-        	self.stopwords = set(file_openstopw.read().split('\r\n'))
+        	self.stopwords_ru = set(file_openstopw.read().split('\r\n'))
 
-        return self.stopwords
+        return self.stopwords_ru
 
 
     def loadVerbForms(self):
@@ -91,29 +148,476 @@ class LoadExternalLists(object):
 
         return self.nountransforms
 
+    def loadLemmaTableRU(self, filename):
+        """
+        Загружаем таблицу форма -> стемма для русского (см. BuildTermSpace.lemmaStemRU).
+        Таблица, построенная другой версией pymorphy2, не используется.
+        """
+
+        if not os.path.exists(filename):
+            return {}
+
+        with open(filename, 'r') as infile:
+            data = json.load(infile)
+
+        if data.get('pymorphy2') != pymorphy2.__version__:
+            print "Lemma table", filename, "was built with another pymorphy2 version, ignored"
+            return {}
+
+        return data['stems']
+
+    def saveLemmaTableRU(self, filename, lemma_table):
+
+        with open(filename + '.tmp', 'w') as outfile:
+            json.dump({'pymorphy2': pymorphy2.__version__, 'stems': lemma_table}, outfile, sort_keys=True)
+
+        replaceFile(filename + '.tmp', filename)
+
     def loadLexiconDe(self):
 
         with open(r'.\lexicon\lexicon_dict_49289.json', 'r') as infile:
 
             self.lexicon_de = json.load(infile)
 
+        self.lexicon_index_de = self.indexLexiconDe(self.lexicon_de)
+        self.suffix_trie_de = self.buildSuffixTrieDe(self.lexicon_index_de)
+
         return self.lexicon_de
 
+    def loadSuffixTrieDe(self):
+        """
+        Обращённое дерево словоформ немецкого лексикона (см. buildSuffixTrieDe)
+        через кэш loadCached: json.load лексикона и сборка индекса и дерева
+        выполняются, только если лексикон изменился с прошлого запуска.
+        """
+
+        self.suffix_trie_de = self.loadCached(r'.\lexicon\lexicon_dict_49289.json', self.parseSuffixTrieDe)
+
+        return self.suffix_trie_de
+
+    def parseSuffixTrieDe(self, filename):
+
+        with open(filename, 'r') as infile:
+            lexicon = json.load(infile)
+
+        return self.buildSuffixTrieDe(self.indexLexiconDe(lexicon))
+
+    def loadCached(self, source, parse):
+        """
+        Результат parse(source), сохранённый в файле source + '.cache' (cPickle).
+        В начале кэша записаны RESOURCE_CACHE_VERSION и sha1 исходного файла,
+        кэш используется, только если они совпали, иначе строится заново.
+        На время загрузки отключается сборщик мусора: при создании множества
+        вложенных словарей он многократно запускается впустую.
+        Если кэш записать не удалось (например, нет прав), результат просто возвращается.
+        """
+
+        key = (RESOURCE_CACHE_VERSION, fileHash(source))
+        cache_path = source + '.cache'
+
+        gc_enabled = gc.isenabled()
+        gc.disable()
+
+        try:
+            if os.path.exists(cache_path):
+                try:
+                    with open(cache_path, 'rb') as infile:
+                        if cPickle.load(infile) == key:
+                            return cPickle.load(infile)
+                except Exception:
+                    # повреждённый или недописанный кэш строится заново
+                    pass
+
+            data = parse(source)
+
+            tmp_path = cache_path + '.' + str(os.getpid()) + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as outfile:
+                    cPickle.dump(key, outfile, cPickle.HIGHEST_PROTOCOL)
+                    cPickle.dump(data, outfile, cPickle.HIGHEST_PROTOCOL)
+                if os.path.exists(cache_path):
+                    os.remove(cache_path)
+                os.rename(tmp_path, cache_path)
+            except (IOError, OSError):
+                print "Can't write resource cache", cache_path
+
+            return data
+
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def indexLexiconDe(self, lexicon):
+        """
+        Строим обратный индекс словоформа -> лемма по немецкому лексикону,
+        чтобы при лемматизации проверять суффикс одним обращением к словарю,
+        а не перебором всех лемм подсловаря.
+        В индекс попадают только те словоформы, которые находил прежний поиск:
+        подсловарь из ALPHABET_DE и первые три буквы формы совпадают с его ключом.
+        Если форма есть у нескольких лемм, остаётся первая в порядке обхода подсловаря.
+        """
+
+        index = {}
+
+        for prefix3, lemmas in lexicon.iteritems():
+            if prefix3 not in ALPHABET_DE:
+                continue
+            for lemma, wordforms in lemmas.iteritems():
+                for wordform in wordforms:
+                    if wordform[:3] == prefix3 and wordform not in index:
+                        index[wordform] = lemma
+
+        return index
+
+    def buildSuffixTrieDe(self, lexicon_index):
+        """
+        Строим обращённое префиксное дерево (trie) по всем словоформам индекса.
+        Словоформа вставляется с последней буквы к первой, в узле её первой
+        буквы под ключом '' хранится лемма. Тогда один проход по слову справа
+        налево находит самый длинный известный суффикс (см. NormalizerDE.lemmatize).
+        """
+
+        trie = {}
+
+        for wordform, lemma in lexicon_index.iteritems():
+            node = trie
+            for char in reversed(wordform):
+                node = node.setdefault(char, {})
+            node[''] = lemma
+
+        return trie
+
+
+# управляющие символы, которые бывают старшими байтами utf-16 (см. DocumentReader.utf16ByteOrder),
+# без \t, \n, \r и т.п., которые встречаются в обычном тексте
+UTF16_HIGH_BYTES = re.compile(b'[\x00-\x08\x0e-\x1f]')
+
+
+class DocumentReader(object):
+
+	"""
+	Чтение документов корпуса. Файл читается большими блоками (или через mmap),
+	блок целиком декодируется и разбивается на строки, так что на каждую строку
+	не приходится отдельного обращения к codecs.
+	Кодировка определяется по началу файла: по BOM, иначе перебором encodings.
+	errors - что делать, если файл не декодируется:
+	'replace' - заменить плохие байты на U+FFFD и читать дальше,
+	'ignore' - выбросить плохие байты и читать дальше,
+	'skip' - дочитать до плохих байтов и бросить остаток файла (так было раньше),
+	'strict' - пробросить исключение.
+	Во всех режимах, кроме 'strict', о проблеме с файлом печатается сообщение.
+	"""
+
+	def __init__(self, encodings=('utf-16', 'utf-8', 'cp1251'), errors='replace', chunk_size=1048576, use_mmap=False):
+
+		self.encodings = tuple(encodings)
+		self.errors = errors
+		self.chunk_size = chunk_size
+		self.use_mmap = use_mmap
+
+
+	def detectEncoding(self, head):
+		"""
+		Определяет кодировку по первому блоку байтов файла.
+		utf-16 без BOM узнаётся по распределению байтов (см. utf16ByteOrder)
+		и читается как utf-16-le или utf-16-be, остальные кодировки с нулевыми
+		байтами не принимаются.
+		Возвращает None, если не подошла ни одна.
+		"""
+
+		if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+			return 'utf-16'
+		if head.startswith(codecs.BOM_UTF8):
+			return 'utf-8-sig'
+
+		has_nul = b'\x00' in head
+		utf16_order = self.utf16ByteOrder(head)
+
+		for encoding in self.encodings:
+			if encoding.replace('_', '-').lower().startswith('utf-16'):
+				if utf16_order is None:
+					continue
+				encoding = utf16_order
+			elif has_nul:
+				continue
+			try:
+				codecs.getincrementaldecoder(encoding)().decode(head, False)
+			except UnicodeError:
+				continue
+			return encoding
+
+		return None
+
+
+	def utf16ByteOrder(self, head, sample_size=4096):
+		"""
+		Порядок байтов utf-16 без BOM по первым sample_size байтам: 'utf-16-le',
+		'utf-16-be' или None, если это не utf-16. У символов одного алфавита
+		старшие байты почти все одинаковые и это управляющие символы (0x00 у латиницы,
+		0x04 у кириллицы), в тексте в однобайтовых кодировках и utf-8 таких байтов нет.
+		Старшими считаются байты на тех местах (чётных или нечётных), где управляющих
+		символов больше, два самых частых значения должны занимать не меньше 90% этих мест.
+		"""
+
+		sample = head[:sample_size]
+		sample = sample[:len(sample) - len(sample) % 2]
+
+		if not UTF16_HIGH_BYTES.search(sample):
+			return None
+
+		even, odd = sample[0::2], sample[1::2]
+		if len(UTF16_HIGH_BYTES.findall(odd)) >= len(UTF16_HIGH_BYTES.findall(even)):
+			high, order = odd, 'utf-16-le'
+		else:
+			high, order = even, 'utf-16-be'
+
+		if sum(count for value, count in Counter(high).most_common(2)) < 0.9 * len(high):
+			return None
+
+		return order
+
+
+	def iterChunks(self, infile):
+		"""
+		Возвращает байты файла блоками по chunk_size.
+		"""
+
+		if self.use_mmap:
+			size = os.fstat(infile.fileno()).st_size
+			if size == 0:
+				return
+			data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				for pos in xrange(0, size, self.chunk_size):
+					yield data[pos:pos+self.chunk_size]
+			finally:
+				data.close()
+		else:
+			while True:
+				chunk = infile.read(self.chunk_size)
+				if not chunk:
+					return
+				yield chunk
+
+
+	def readLines(self, filename, data=None):
+		"""
+		Генератор строк файла (с символами конца строки, как при итерации по codecs.open).
+		data - уже прочитанное содержимое файла (см. FilePrefetcher), тогда файл
+		не открывается, а строки декодируются из data.
+		"""
+
+		if data is not None:
+			chunks = (data[pos:pos+self.chunk_size] for pos in xrange(0, len(data), self.chunk_size))
+			for line in self.decodeChunks(filename, chunks):
+				yield line
+			return
+
+		with open(filename, 'rb') as infile:
+			for line in self.decodeChunks(filename, self.iterChunks(infile)):
+				yield line
+
+
+	def decodeChunks(self, filename, chunks):
+		"""
+		Декодирует блоки байтов файла filename в строки.
+		Последняя строка блока может быть неполной, поэтому она откладывается
+		и склеивается с началом следующего блока.
+		"""
+
+		if self.errors in ('skip', 'strict'):
+			decode_errors = 'strict'
+		else:
+			decode_errors = self.errors
+
+		decoder = None
+		tail = ''
+
+		for chunk in chunks:
+
+			if decoder is None:
+				encoding = self.detectEncoding(chunk)
+				if encoding is None:
+					if decode_errors == 'strict':
+						raise UnicodeError("unknown encoding, tried: " + ", ".join(self.encodings))
+					encoding = self.encodings[0]
+				decoder = codecs.getincrementaldecoder(encoding)(decode_errors)
+
+			state = decoder.getstate()
+			try:
+				text = decoder.decode(chunk)
+			except UnicodeDecodeError as err:
+				if self.errors != 'skip':
+					raise
+				# декодируем блок до плохих байтов, остаток файла бросаем
+				# (плохие байты могли начаться ещё в недекодированном остатке прошлого блока)
+				good_bytes = err.start - len(state[0])
+				if good_bytes > 0:
+					decoder.setstate(state)
+					tail += decoder.decode(chunk[:good_bytes])
+				for line in tail.splitlines(True):
+					yield line
+				print "Skipping rest of", filename, "-", err
+				return
+
+			lines = (tail + text).splitlines(True)
+			if not lines:
+				continue
+
+			tail = lines.pop()
+			for line in lines:
+				yield line
+
+		if decoder is not None:
+			try:
+				tail += decoder.decode(b'', True)
+			except UnicodeDecodeError as err:
+				# файл оборван посреди символа
+				if self.errors != 'skip':
+					raise
+				print "Skipping rest of", filename, "-", err
+
+		for line in tail.splitlines(True):
+			yield line
+
+
+	def iterLines(self, filename, data=None):
+		"""
+		То же, что readLines, но ошибки чтения и декодирования обрабатываются по политике errors.
+		"""
+
+		try:
+			for line in self.readLines(filename, data):
+				yield line
+
+		except (UnicodeError, IOError) as err:
+			if self.errors == 'strict':
+				raise
+			print "Skipping rest of", filename, "-", err
+
+
+
+class FilePrefetcher(object):
+
+	"""
+	Упреждающее чтение файлов корпуса пулом потоков: пока разбирается один файл,
+	следующие depth файлов уже читаются в threads потоков. Нужно, когда корпус
+	лежит на сетевом диске и время уходит на ожидание open/read, а не на разбор.
+	Файлы читаются целиком, поэтому в памяти не больше depth файлов; файлы
+	больше max_size не читаются заранее, их DocumentReader читает сам блоками.
+	"""
+
+	def __init__(self, threads=4, depth=16, max_size=67108864):
+
+		self.threads = threads
+		self.depth = depth
+		self.max_size = max_size
+
+
+	def readFile(self, filename):
+		"""
+		Содержимое файла или None, если файл слишком большой или не читается:
+		тогда его читает DocumentReader и ошибки обрабатываются как обычно.
+		"""
+
+		try:
+			with open(filename, 'rb') as infile:
+				if os.fstat(infile.fileno()).st_size > self.max_size:
+					return None
+				return infile.read()
+		except (IOError, OSError):
+			return None
+
+
+	def iterFiles(self, filenames):
+		"""
+		Генератор пар (filename, data) в порядке filenames, data - результат readFile.
+		filenames перебираются не больше чем на depth файлов вперёд.
+		"""
+
+		pool = ThreadPool(self.threads)
+		pending = deque()
+
+		try:
+			for filename in filenames:
+				pending.append((filename, pool.apply_async(self.readFile, (filename,))))
+				if len(pending) >= self.depth:
+					filename, result = pending.popleft()
+					yield filename, result.get()
+
+			while pending:
+				filename, result = pending.popleft()
+				yield filename, result.get()
+		finally:
+			pool.terminate()
+
+
+
+class TokenizerProfile(object):
+
+	"""
+	Всё, что нужно для разбивки и очистки токенов одного языка, собранное один раз:
+	скомпилированные регулярные выражения, знаки пунктуации и таблица замены умлаутов.
+	Создаётся в LanguageResources.__init__ (BuildTermSpace берёт его оттуда как profile)
+	и передаётся нормализаторам, чтобы ничего из этого не пересобиралось на каждой
+	строке или на каждом токене.
+	"""
+
+	def __init__(self, language):
+
+		self.language = language
+
+		# для разбивки на токены по пробелам и слешам
+		self.splitchars = re.compile(r'[\s\\\/\(\)\[\]\<\>\;\:\,\‚\—\?\!\|\"«»…#]|\.\.\.+|[ �⌂ ∞½¾►=]|\-\-|\.[\'\"’“”«»‘′″„-]') # [\.\:][\'\"’“”«»‘′″]
+
+		# для игнорирования токенов, содержащих цифры
+		self.esc_num = re.compile(r'[0-9]+')
+
+		# для игнорирования URL
+		#url_esc = re.compile(r'([a-z]{3,6}:\/\/)?([a-zA-Z0-9\-@?]+[\.|\:])+[a-z]{2,13}[\.\?\=\&\%\,\#\+\(\)\/\w\-]*')
+
+		# знаки, которые будут удаляться в начале и конце токена
+		self.punctuation = "∙!‼¡\"#£€$¥%&'()*+±×÷·,-./:;<=>?¿@[\]^ˆ¨_`—–­{|}~≈≠→↓¬’“”«»≫‘…¦›🌼′″¹§¼⅜½¾⅘©✒•►●★❤➡➜➚➘➔✔➓➒➑➐➏➎➍➌➋➊❸❷■†✝✌￼️³‎²‚„ ​"
+
+		# токены, которые отбрасываются при любой очистке: с цифрами (очистка цифр
+		# не удаляет) и только из знаков пунктуации (после strip пустые), см. LanguageResources.isDroppedToken
+		self.drop_chars = re.compile(r'[0-9]|\A[' + re.escape(self.punctuation) + r']*\Z')
+
+		# для удаления в конце слов сокращений типа you've, don't и пр.
+		if language == 'de':
+			self.del_endings = re.compile(r'[\'\’`‘]+[s|m|t|d|n]$|[\'\’‘`]+(ve|ll|re|nt|ya|yer)$')
+		else:
+			self.del_endings = re.compile(r'[\'\’]+[s|m|t|d|n]$|[\'\’](ve|ll|re|nt|ya|yer)$')
+
+		# cyr_err = {'д':'ä', 'ц':'ö', 'ь':'ü', 'Я':'ß', 'Д':'Ä', 'Ц':'Ö', 'Ь':'Ü'}
+		# umlauts_case = {'ä':'ae', 'ö':'oe', 'ü':'ue', 'ß':'ss', 'Ä':'Ae', 'Ö':'Oe', 'Ü':'ue', 'д':'ae', 'ц':'oe', 'ь':'ue', 'Я':'ss', 'Д':'Ae', 'Ц':'Oe', 'Ь':'Ue'}
+		umlauts = {'ä':'ae', 'ö':'oe', 'ü':'ue', 'ß':'ss', 'д':'ae', 'ц':'oe', 'ь':'ue', 'Я':'ss', 'ä':'ae', 'ö':'oe', 'ü':'ue'}
+
+		# умлауты из одного символа заменяются за один проход unicode.translate,
+		# умлауты с комбинируемым диакритическим знаком (a + U+0308) - через replace
+		self.umlaut_table = dict((ord(umlaut), ersatz) for umlaut, ersatz in umlauts.iteritems() if len(umlaut) == 1)
+		self.combining_umlauts = tuple((umlaut, ersatz) for umlaut, ersatz in umlauts.iteritems() if len(umlaut) > 1)
+
+
 
 class NormalizerDE(object):
 
+	def __init__(self, profile):
+
+		# TokenizerProfile('de')
+		self.profile = profile
+
 	
 	def normalizeUmlaut(self, word):
 		"""
 		Конвертируем немекцие умлауты для унификации. Обратного преобразования не предусмотрено.
+		Таблица замены берётся из TokenizerProfile.
 		"""
 
-		# cyr_err = {'д':'ä', 'ц':'ö', 'ь':'ü', 'Я':'ß', 'Д':'Ä', 'Ц':'Ö', 'Ь':'Ü'}
-		# umlauts_case = {'ä':'ae', 'ö':'oe', 'ü':'ue', 'ß':'ss', 'Ä':'Ae', 'Ö':'Oe', 'Ü':'ue', 'д':'ae', 'ц':'oe', 'ь':'ue', 'Я':'ss', 'Д':'Ae', 'Ц':'Oe', 'Ь':'Ue'}
-		umlauts = {'ä':'ae', 'ö':'oe', 'ü':'ue', 'ß':'ss', 'д':'ae', 'ц':'oe', 'ь':'ue', 'Я':'ss', 'ä':'ae', 'ö':'oe', 'ü':'ue'}
+		word = word.translate(self.profile.umlaut_table)
 
-		for umlaut, ersatz in umlauts.iteritems():
-			if umlaut in word:
+		if '\u0308' in word:
+			for umlaut, ersatz in self.profile.combining_umlauts:
 				word = word.replace(umlaut, ersatz)
 				
 		return word
@@ -125,8 +629,7 @@ class NormalizerDE(object):
 		Если паттерн окончания всё ещё найден у слова (англ: I'd've), то ещё раз применяем метод re.sub.
 		"""
 
-		# для удаления в конце слов сокращений типа you've, don't и пр.
-		del_endings = re.compile(r'[\'\’`‘]+[s|m|t|d|n]$|[\'\’‘`]+(ve|ll|re|nt|ya|yer)$')
+		del_endings = self.profile.del_endings
 
 		no_endings = del_endings.sub('', str1)
 
@@ -140,39 +643,42 @@ class NormalizerDE(object):
 			return no_endings
 
 
-	def lemmatize(self, word, lexicon):
+	def lemmatize(self, word, suffix_trie):
 		"""
 		Функция лемматизации немецких слов.
 		Подгружается особым образом сформированный лексикон.
 		Структура лексикона: питоновские вложенные словари.
-		Первый уровень - первые три буквы слова (см. перем. alphabet).
+		Первый уровень - первые три буквы слова (см. ALPHABET_DE).
 		Внутри первого уровня слова, начинающиеся на эту букву, ключ - лемма,
-		значение - список словоформ этой леммы. Выделение трех букв сделано
-		для того, чтобы как-то уменьшить время поиска словоформы. Так не надо
-		пробегать по всему словарю, а искать только в одном подсловаре.
+		значение - список словоформ этой леммы.
+		По лексикону при загрузке строится обращённое префиксное дерево словоформ
+		(LoadExternalLists.buildSuffixTrieDe), оно и передаётся в suffix_trie.
 		Поиск:
-		Поиск идёт по списку словоформ, пока не встретится подходящая форма.
-		Сначала слово ищется целиком, если не находится, откусывается первая
-		буква слева и так до конца. Таким образом обрабатываются новые 
+		Ищется самый длинный суффикс слова, который есть в лексиконе как словоформа,
+		к оставшемуся префиксу приклеивается лемма. Таким образом обрабатываются новые 
 		слова с префиксами (ueberbakterien) и слова-компаунды (krankenversicherungsbescheinigungen),
-		которых нет в ktrcbrjyt, но есть их последняя часть (bescheinigungen).
+		которых нет в лексиконе, но есть их последняя часть (bescheinigungen).
+		Слово проходится по дереву один раз справа налево, поэтому поиск
+		линеен по длине слова, а не квадратичен, как при проверке каждого суффикса.
 		"""
 
-		alphabet = tuple(["aac", "aal", "aas", "aba", "abb", "abc", "abd", "abe", "abf", "abg", "abh", "abi", "abj", "abk", "abl", "abm", "abn", "abo", "abp", "abq", "abr", "abs", "abt", "abu", "abv", "abw", "abz", "acc", "ach", "ack", "act", "ada", "add", "ade", "adh", "adj", "adl", "adm", "ado", "adr", "ads", "adv", "aeb", "aec", "aed", "aef", "aeg", "aeh", "ael", "aem", "aen", "aep", "aeq", "aer", "aes", "aet", "aeu", "aex", "aff", "afg", "afr", "aft", "aga", "age", "agg", "agi", "ago", "agr", "ags", "ahl", "ahm", "ahn", "aho", "air", "aka", "akk", "akn", "ako", "akq", "akr", "akt", "aku", "akw", "akz", "ala", "alb", "alc", "ale", "alf", "alg", "ali", "alk", "all", "alm", "alp", "alr", "als", "alt", "alu", "alz", "ama", "amb", "ame", "amh", "ami", "amm", "amn", "amo", "amp", "ams", "amt", "amu", "ana", "anb", "and", "ane", "anf", "ang", "anh", "ani", "anj", "ank", "anl", "anm", "ann", "ano", "anp", "anq", "anr", "ans", "ant", "anv", "anw", "anz", "aor", "apa", "ape", "apf", "aph", "apo", "app", "apr", "aps", "aqu", "ara", "arb", "arc", "ard", "are", "arg", "arh", "ari", "ark", "arm", "arn", "aro", "arr", "ars", "art", "arz", "asb", "asc", "ase", "asi", "ask", "aso", "asp", "ass", "ast", "asy", "asz", "ate", "ath", "atl", "atm", "ato", "atr", "att", "atu", "aub", "aud", "aue", "auf", "aug", "auh", "auk", "aul", "aup", "aur", "aus", "aut", "ava", "ave", "avi", "axe", "axi", "aza", "aze", "azt", "azu", "bab", "bac", "bad", "bae", "baf", "bag", "bah", "bai", "baj", "bak", "bal", "bam", "ban", "bap", "bar", "bas", "bat", "bau", "bay", "baz", "bea", "beb", "bec", "bed", "bee", "bef", "beg", "beh", "bei", "bej", "bek", "bel", "bem", "ben", "beo", "bep", "beq", "ber", "bes", "bet", "beu", "bev", "bew", "bez", "bia", "bib", "bie", "big", "bik", "bil", "bim", "bin", "bio", "bir", "bis", "bit", "biw", "biz", "bjo", "bla", "ble", "bli", "blo", "blu", "bmw", "boa", "bob", "boc", "bod", "boe", "bog", "boh", "boi", "boj", "bol", "bom", "bon", "boo", "bor", "bos", "bot", "bou", "bow", "box", "boy", "bra", "bre", "bri", "bro", "bru", "bub", "buc", "bud", "bue", "buf", "bug", "buh", "buk", "bul", "bum", "bun", "bur", "bus", "but", "byt", "byz", "cac", "cad", "cae", "caf", "cag", "cal", "cam", "can", "cap", "car", "cas", "cd-", "cds", "cea", "cel", "cem", "cen", "ceo", "cer", "ces", "cey", "cha", "che", "chi", "chl", "cho", "chr", "cie", "cin", "cit", "cla", "cle", "cli", "clo", "clu", "coa", "coc", "cod", "coh", "coi", "cok", "col", "com", "con", "coo", "cop", "cor", "cou", "cov", "cow", "coy", "cpu", "cra", "cre", "cro", "cto", "cup", "cur", "cut", "cya", "cyb", "cyr", "dab", "dac", "dad", "dae", "daf", "dag", "dah", "dai", "dak", "dal", "dam", "dan", "dar", "das", "dat", "dau", "dav", "daw", "daz", "dea", "deb", "dec", "ded", "dee", "def", "deg", "deh", "dei", "dej", "dek", "del", "dem", "den", "deo", "dep", "der", "des", "det", "deu", "dev", "dez", "di.", "dia", "dic", "did", "die", "dif", "dig", "dik", "dil", "dim", "din", "dio", "dip", "dir", "dis", "dit", "div", "diw", "djs", "do.", "doc", "dod", "doe", "dog", "doh", "dok", "dol", "dom", "don", "doo", "dop", "dor", "dos", "dot", "dou", "dow", "doz", "dra", "dre", "dri", "dro", "dru", "dsc", "dtu", "dua", "dub", "duc", "dud", "due", "duf", "dui", "dul", "dum", "dun", "duo", "dup", "dur", "dus", "dut", "duz", "dvd", "dyn", "dys", "ebb", "ebe", "ebn", "ech", "eck", "ecu", "edb", "edd", "ede", "edg", "edi", "edl", "edm", "edu", "efe", "eff", "ega", "ege", "egg", "ego", "ehe", "ehr", "eib", "eic", "eid", "eie", "eif", "eig", "eil", "eim", "ein", "eis", "eit", "eiw", "eiz", "eja", "eje", "eke", "ekl", "eks", "ekz", "ela", "elc", "eld", "ele", "elf", "eli", "elk", "ell", "elm", "elo", "els", "elt", "ema", "emb", "eme", "emi", "emm", "emo", "emp", "ems", "emu", "enc", "end", "ene", "enf", "eng", "enk", "eno", "ens", "ent", "enu", "enz", "epe", "epi", "epo", "epp", "eps", "equ", "era", "erb", "erc", "erd", "ere", "erf", "erg", "erh", "eri", "erj", "erk", "erl", "erm", "ern", "ero", "erp", "erq", "err", "ers", "ert", "eru", "erw", "erz", "esc", "ese", "esk", "eso", "esp", "ess", "est", "eta", "eth", "eti", "etu", "etw", "ety", "euc", "eug", "eul", "eun", "eup", "eur", "eut", "eva", "eve", "evi", "evo", "ewi", "exa", "exc", "exe", "exh", "exi", "exk", "exm", "exn", "exo", "exp", "exq", "exs", "ext", "exz", "eyl", "fab", "fac", "fad", "fae", "fag", "fah", "fai", "fak", "fal", "fam", "fan", "far", "fas", "fat", "fau", "fav", "fax", "faz", "fea", "feb", "fec", "fed", "fee", "feg", "feh", "fei", "fel", "fem", "fen", "fer", "fes", "fet", "feu", "fez", "fia", "fib", "fic", "fid", "fie", "fig", "fik", "fil", "fim", "fin", "fir", "fis", "fit", "fix", "fjo", "fla", "fle", "fli", "flo", "flu", "fly", "foc", "foe", "foh", "fok", "fol", "fon", "fop", "for", "fos", "fot", "fou", "foy", "fr.", "fra", "fre", "fri", "fro", "fru", "fuc", "fue", "fuf", "fug", "fuh", "ful", "fum", "fun", "fur", "fus", "fut", "g'f", "g'm", "g'n", "g'r", "g's", "g'w", "gab", "gad", "gae", "gaf", "gag", "gal", "gam", "gan", "gar", "gas", "gat", "gau", "gaz", "gbs", "gby", "gea", "geb", "gec", "ged", "gee", "gef", "geg", "geh", "gei", "gej", "gek", "gel", "gem", "gen", "geo", "gep", "geq", "ger", "ges", "get", "geu", "gev", "gew", "gez", "gha", "ghe", "ghu", "gib", "gie", "gif", "gig", "gil", "gim", "gin", "gip", "gir", "gis", "git", "giu", "gla", "gle", "gli", "glo", "glu", "gly", "gmb", "gna", "gne", "gno", "gnu", "gob", "goc", "god", "goe", "gog", "gol", "gom", "gon", "gor", "gos", "got", "gou", "gra", "gre", "gri", "gro", "gru", "gua", "guc", "gud", "gue", "gui", "gul", "gum", "gun", "gur", "gus", "gut", "gym", "gyn", "gys", "g‘f", "g‘m", "g‘n", "g‘r", "g‘s", "g‘w", "g’f", "g’m", "g’n", "g’r", "g’s", "g’w", "haa", "hab", "hac", "had", "hae", "haf", "hag", "hah", "hai", "hak", "hal", "ham", "han", "hap", "har", "has", "hat", "hau", "hav", "haw", "hax", "hay", "haz", "hea", "heb", "hec", "hed", "hee", "hef", "heg", "heh", "hei", "hek", "hel", "hem", "hen", "her", "hes", "het", "heu", "hex", "hey", "hic", "hie", "hig", "hil", "him", "hin", "hip", "hir", "his", "hit", "hiw", "hob", "hoc", "hod", "hoe", "hof", "hoh", "hok", "hol", "hom", "hon", "hoo", "hop", "hor", "hos", "hot", "hou", "hoy", "hub", "huc", "hue", "huf", "hug", "huh", "hul", "hum", "hun", "hup", "hur", "hus", "hut", "hya", "hyb", "hyd", "hye", "hyg", "hym", "hyp", "hys", "ibm", "ibr", "ico", "ics", "ide", "idi", "ido", "idy", "ige", "igl", "ign", "igo", "ike", "iko", "ilb", "ill", "ils", "ilt", "ima", "imb", "imi", "imk", "imm", "imp", "ina", "inb", "inc", "ind", "ine", "inf", "ing", "inh", "ini", "inj", "ink", "inl", "inn", "ino", "inq", "ins", "int", "inv", "inw", "inz", "iod", "ion", "iqs", "ira", "ird", "ire", "iri", "irl", "irm", "iro", "irr", "isa", "ise", "isl", "ism", "iso", "isr", "iss", "ist", "ita", "ite", "iva", "iza", "ize", "jac", "jae", "jag", "jah", "jak", "jal", "jam", "jan", "jap", "jar", "jas", "jau", "jaw", "jaz", "jea", "jec", "jed", "jee", "jel", "jen", "jer", "jes", "jet", "jew", "jim", "jin", "joa", "job", "joc", "jod", "joe", "jog", "joh", "joi", "jok", "jol", "jon", "jop", "jor", "jos", "jot", "jou", "jov", "jua", "jub", "juc", "jud", "jue", "jug", "jul", "jum", "jun", "jup", "jur", "jus", "jut", "juw", "jux", "jva", "kab", "kac", "kad", "kae", "kaf", "kah", "kai", "kaj", "kak", "kal", "kam", "kan", "kap", "kar", "kas", "kat", "kau", "kav", "kbi", "kbs", "kby", "keb", "kec", "kee", "kef", "keg", "keh", "kei", "kek", "kel", "kem", "ken", "ker", "kes", "ket", "keu", "kev", "kha", "kib", "kic", "kid", "kie", "kif", "kil", "kim", "kin", "kio", "kip", "kir", "kis", "kit", "kiw", "kla", "kle", "kli", "klo", "klu", "kna", "kne", "kni", "kno", "knu", "koa", "kob", "koc", "kod", "koe", "kof", "kog", "koh", "koi", "koj", "kok", "kol", "kom", "kon", "koo", "kop", "kor", "kos", "kot", "kra", "kre", "kri", "kro", "kru", "kry", "kub", "kuc", "kue", "kuf", "kug", "kuh", "kul", "kum", "kun", "kup", "kur", "kus", "kut", "kuv", "kuw", "kyb", "kyr", "kzs", "lab", "lac", "lad", "lae", "laf", "lag", "lah", "lai", "lak", "lal", "lam", "lan", "lap", "laq", "lar", "las", "lat", "lau", "lav", "law", "lax", "lay", "laz", "lea", "leb", "lec", "led", "lee", "leg", "leh", "lei", "lek", "lem", "len", "leo", "ler", "les", "let", "leu", "lev", "lex", "lia", "lib", "lic", "lid", "lie", "lif", "lig", "lii", "lik", "lil", "lim", "lin", "lip", "liq", "lis", "lit", "liv", "liz", "lkw", "lob", "loc", "lod", "loe", "lof", "log", "loh", "loi", "lok", "lol", "lom", "lon", "loo", "lor", "los", "lot", "lov", "loy", "lps", "luc", "lud", "lue", "luf", "lug", "luk", "lul", "lum", "lun", "lup", "lur", "lus", "lut", "lux", "luz", "lyk", "lym", "lyn", "lyr", "lys", "maa", "mac", "mad", "mae", "maf", "mag", "mah", "mai", "maj", "mak", "mal", "mam", "man", "map", "mar", "mas", "mat", "mau", "max", "may", "maz", "mbi", "mbs", "mby", "mec", "med", "mee", "meg", "meh", "mei", "mek", "mel", "mem", "men", "mep", "mer", "mes", "met", "meu", "mex", "mey", "mez", "mi.", "mia", "mic", "mie", "mig", "mih", "mik", "mil", "mim", "min", "mir", "mis", "mit", "mix", "mne", "mo.", "mob", "moc", "mod", "moe", "mof", "mog", "moh", "mok", "mol", "mom", "mon", "moo", "mop", "mor", "mos", "mot", "mou", "mov", "moz", "mp3", "mps", "muc", "mue", "muf", "mul", "mum", "mun", "mur", "mus", "mut", "myr", "mys", "myt", "nab", "nac", "nad", "nae", "nag", "nah", "nai", "nam", "nan", "nap", "nar", "nas", "nat", "nau", "nav", "naz", "nea", "neb", "nec", "nef", "neg", "neh", "nei", "nek", "nel", "nen", "neo", "nep", "ner", "nes", "net", "neu", "new", "nib", "nic", "nid", "nie", "nig", "nih", "nik", "nil", "nim", "nip", "nir", "nis", "nit", "niv", "nix", "niz", "nob", "noc", "noe", "nom", "non", "nop", "nor", "nos", "not", "nou", "nov", "now", "nua", "nud", "nue", "nuk", "nul", "num", "nus", "nut", "nva", "nyl", "nym", "oas", "obd", "obe", "obg", "obi", "obj", "obl", "obm", "obo", "obr", "obs", "obt", "obu", "obz", "och", "ock", "ode", "odi", "odo", "ody", "oed", "oef", "oeh", "oek", "oel", "oen", "oer", "oes", "ofe", "off", "ohn", "ohr", "okk", "okt", "oku", "okz", "ola", "old", "ole", "olf", "olg", "oli", "oll", "oly", "oma", "ome", "omi", "omn", "ona", "onk", "ont", "ony", "opa", "ope", "opf", "opi", "opo", "opp", "opt", "opu", "ora", "orb", "orc", "ord", "org", "ori", "ork", "orl", "orn", "ort", "osc", "osk", "osl", "osm", "osn", "osr", "oss", "ost", "osz", "oto", "ott", "out", "ouv", "ouz", "ova", "ove", "ovu", "owe", "oxi", "oxy", "oze", "ozo", "paa", "pac", "pad", "pae", "paf", "pag", "pak", "pal", "pam", "pan", "pap", "par", "pas", "pat", "pau", "pav", "paz", "pcs", "pda", "pec", "ped", "peg", "pei", "pej", "pek", "pel", "pen", "pep", "per", "pes", "pet", "pfa", "pfe", "pfi", "pfl", "pfo", "pfr", "pfu", "pha", "phe", "phi", "phl", "pho", "phr", "phy", "pia", "pic", "pie", "pig", "pik", "pil", "pim", "pin", "pio", "pip", "pir", "pis", "pit", "pix", "piz", "pkw", "pla", "ple", "pli", "plo", "plu", "pne", "poc", "pod", "poe", "pog", "poh", "poi", "pok", "pol", "pom", "pon", "poo", "pop", "por", "pos", "pot", "pow", "pra", "pre", "pri", "pro", "prs", "pru", "psa", "psc", "pse", "psy", "pub", "puc", "pud", "pue", "puf", "pul", "pum", "pun", "pup", "pur", "pus", "put", "puz", "pvc", "pyg", "pyj", "pyr", "pyt", "qua", "que", "qui", "quo", "rab", "rac", "rad", "rae", "raf", "rag", "rah", "rai", "rak", "ral", "ram", "ran", "rap", "rar", "ras", "rat", "rau", "rav", "raz", "rea", "reb", "rec", "red", "ree", "ref", "reg", "reh", "rei", "rej", "rek", "rel", "rem", "ren", "reo", "rep", "req", "res", "ret", "reu", "rev", "rex", "rez", "rha", "rhe", "rhi", "rho", "rhy", "rib", "ric", "rie", "rif", "rig", "rik", "ril", "rin", "rio", "rip", "ris", "rit", "riv", "riz", "roa", "rob", "roc", "rod", "roe", "rog", "roh", "rok", "rol", "rom", "ron", "ros", "rot", "rou", "row", "roy", "rtl", "rua", "rub", "ruc", "rud", "rue", "ruf", "ruh", "rui", "rum", "run", "rup", "rus", "rut", "rws", "ryb", "sa.", "saa", "sab", "sac", "sad", "sae", "saf", "sag", "sah", "sai", "sak", "sal", "sam", "san", "sap", "sar", "sas", "sat", "sau", "sav", "sax", "sca", "sce", "sch", "sci", "scr", "sea", "seb", "sec", "sed", "see", "seg", "seh", "sei", "sek", "sel", "sem", "sen", "seo", "sep", "seq", "ser", "ses", "set", "seu", "sex", "sez", "sha", "she", "shi", "sho", "shr", "shu", "sia", "sib", "sic", "sid", "sie", "sig", "sik", "sil", "sim", "sin", "sip", "sir", "sis", "sit", "ska", "ske", "ski", "skl", "sko", "skr", "sku", "sky", "sla", "sli", "slo", "slu", "sma", "smo", "sna", "sni", "sno", "so.", "soa", "soc", "sod", "soe", "sof", "sog", "soh", "soj", "sol", "som", "son", "sop", "sor", "sos", "sot", "sou", "sow", "soz", "spa", "spe", "sph", "spi", "spl", "spo", "spr", "spu", "squ", "sta", "ste", "sti", "sto", "str", "stu", "sty", "sub", "suc", "sud", "sue", "suf", "sug", "suh", "sui", "suj", "suk", "sul", "sum", "sup", "sur", "sus", "sut", "sve", "swe", "swi", "syl", "sym", "syn", "syr", "sys", "sze", "tab", "tac", "tad", "tae", "taf", "tag", "tai", "tak", "tal", "tam", "tan", "tao", "tap", "tar", "tas", "tat", "tau", "tav", "tax", "tay", "tby", "tea", "tec", "ted", "tee", "teg", "teh", "tei", "tek", "tel", "tem", "ten", "tep", "ter", "tes", "teu", "tex", "tha", "the", "thi", "tho", "thr", "thu", "thy", "tib", "tic", "tid", "tie", "tig", "til", "tim", "tin", "tip", "tir", "tis", "tit", "toa", "tob", "toc", "tod", "toe", "toh", "toi", "tok", "tol", "tom", "ton", "too", "top", "tor", "tos", "tot", "tou", "tox", "toy", "tra", "tre", "tri", "tro", "tru", "tsa", "tsc", "tse", "tub", "tuc", "tue", "tug", "tul", "tum", "tun", "tup", "tur", "tus", "tut", "tvs", "twi", "tyc", "typ", "tyr", "udo", "ueb", "uel", "uep", "uer", "ufe", "uff", "ufr", "uhr", "uhu", "ukr", "uku", "ulf", "uli", "ulk", "ulm", "ulr", "ult", "uma", "umb", "umc", "umd", "ume", "umf", "umg", "umh", "umi", "umj", "umk", "uml", "umm", "umn", "umo", "ump", "umq", "umr", "ums", "umt", "umv", "umw", "umz", "una", "unb", "unc", "und", "une", "unf", "ung", "unh", "uni", "unk", "unl", "unm", "unn", "uno", "unp", "unq", "unr", "uns", "unt", "unu", "unv", "unw", "unz", "upd", "upg", "ura", "urb", "urd", "ure", "urf", "urg", "urh", "uri", "urk", "url", "urm", "urn", "uro", "urp", "urs", "urt", "uru", "urv", "urw", "urz", "usa", "usb", "use", "usi", "usu", "uta", "ute", "uti", "uto", "uwe", "uze", "vae", "vag", "vak", "val", "vam", "van", "var", "vas", "vat", "veg", "veh", "vei", "vek", "ven", "ver", "ves", "vet", "via", "vib", "vic", "vid", "vie", "vik", "vil", "vio", "vip", "vir", "vis", "vit", "viz", "vla", "voe", "vog", "voi", "vok", "vol", "von", "vor", "vos", "vot", "voy", "vul", "vws", "waa", "wab", "wac", "wad", "wae", "waf", "wag", "wah", "wai", "wal", "wam", "wan", "wap", "war", "was", "wat", "way", "wcs", "web", "wec", "wed", "weg", "weh", "wei", "wel", "wen", "wer", "wes", "wet", "wgs", "whi", "wic", "wid", "wie", "wik", "wil", "wim", "win", "wip", "wir", "wis", "wit", "wla", "wms", "wob", "woc", "wod", "woe", "wog", "woh", "wok", "wol", "won", "wor", "wra", "wri", "wuc", "wue", "wul", "wun", "wup", "wur", "wus", "wut", "wyn", "x-b", "xan", "xeo", "xyl", "yac", "yan", "yeb", "yen", "yet", "yog", "yor", "yuc", "yup", "yvo", "zac", "zae", "zag", "zah", "zan", "zap", "zar", "zas", "zau", "zeb", "zec", "zed", "zeh", "zei", "zel", "zem", "zen", "zep", "zer", "zet", "zeu", "zic", "zie", "zif", "zig", "zik", "zim", "zin", "zio", "zip", "zir", "zis", "zit", "ziv", "zlo", "zob", "zoc", "zoe", "zof", "zog", "zol", "zom", "zon", "zoo", "zop", "zor", "zot", "zua", "zub", "zuc", "zud", "zue", "zuf", "zug", "zuh", "zui", "zuj", "zuk", "zul", "zum", "zun", "zuo", "zup", "zuq", "zur", "zus", "zut", "zuv", "zuw", "zuz", "zwa", "zwe", "zwi", "zwo", "zya", "zyk", "zyl", "zyn", "zyp", "zys"])
+		node = suffix_trie
+		lemma = None
+		cut = 0
 
-		got_lemma = False
-		for l in range(len(word)):
-			word_no_prefix = word[l:]
-			prefix = word[:l]
-			if word_no_prefix[:3] in alphabet:
-				for lemma, wordforms in lexicon[word_no_prefix[:3]].iteritems():
-					if word_no_prefix in tuple(wordforms):
-						got_lemma = True
-						return prefix+lemma
+		for i in xrange(len(word)-1, -1, -1):
+			node = node.get(word[i])
+			if node is None:
+				break
+			if '' in node:
+				lemma = node['']
+				cut = i
 
-		if not got_lemma:
+		if lemma is None:
 			return word
 
+		return word[:cut]+lemma
+
 
 
 class NormalizerRU(object):
@@ -192,6 +698,11 @@ class NormalizerRU(object):
 
 class NormalizerEN(object):
 
+	def __init__(self, profile):
+
+		# TokenizerProfile('en')
+		self.profile = profile
+
 
 	def del_contractions(self, str1):
 		"""
@@ -199,8 +710,7 @@ class NormalizerEN(object):
 		Если паттерн окончания всё ещё найден у слова (I'd've), то ещё раз применяем метод re.sub.
 		"""
 
-		# для удаления в конце слов сокращений типа you've, don't и пр.
-		del_endings = re.compile(r'[\'\’]+[s|m|t|d|n]$|[\'\’](ve|ll|re|nt|ya|yer)$')
+		del_endings = self.profile.del_endings
 
 		no_endings = del_endings.sub('', str1)
 
@@ -229,197 +739,2416 @@ class NormalizerEN(object):
 
 
 
-class BuildTermSpace(object):
+class LanguageResources(object):
 
 	"""
-	Создание json-объекта в виде словаря, в котором хранятся стеммы
-	значимых слов и их частотность из указанных корпусов.
+	Всё, что нужно для обработки токенов одного языка: TokenizerProfile,
+	стоп-слова, нормализатор и стеммер, для en - формы неправильных глаголов
+	и существительных, для de - дерево суффиксов лексикона, для ru - морфоанализатор pymorphy2.
+	Ресурсы загружаются не в конструкторе, а при первом обращении к любому
+	из LAZY_ATTRIBUTES (или явным вызовом load), один раз. Дерево суффиксов
+	берётся из кэша (см. LoadExternalLists.loadCached).
+	После загрузки объект не меняется: присваивать атрибуты нельзя, словари
+	и множества только читаются, а cleanToken, stemTerm, normalizeToken
+	и processString ничего не запоминают между вызовами. Поэтому один объект
+	(например, с загруженным немецким лексиконом) можно передать нескольким
+	BuildTermSpace или вызывать из нескольких потоков одновременно.
+	Изменяемое состояние - кэш токенов и таблица форм ru - хранится в BuildTermSpace.
 	"""
 
-	def __init__(self, language='en', action='tfidf'):
+	LAZY_ATTRIBUTES = frozenset(['stopwords', 'stemmer', 'normalizer', 'irreg_verbs', 'irreg_nouns', 'suffix_trie_de', 'lemmatizer_ru', 'clean_stages', 'stem_stages', 'drop_tokens', 'drop_chars'])
+
+	def __init__(self, language='en'):
 
-		# Вызываем LoadExternalLists, создаем список стоп-слов, 
-		# загружаем немецкий лексикон,
-		# 
 		self.language = language
-		self.action = action
+		# регулярные выражения и таблицы для разбивки и очистки токенов
+		self.profile = TokenizerProfile(language)
 
-		# знаки, которые будут удаляться в начале и конце токена
-		self.punctuation = "∙!‼¡\"#£€$¥%&'()*+±×÷·,-./:;<=>?¿@[\]^ˆ¨_`—–­{|}~≈≠→↓¬’“”«»≫‘…¦›🌼′″¹§¼⅜½¾⅘©✒•►●★❤➡➜➚➘➔✔➓➒➑➐➏➎➍➌➋➊❸❷■†✝✌￼️³‎²‚„ ​"
+		self._lock = threading.Lock()
+		self._frozen = True
+
+
+	def __setattr__(self, name, value):
+
+		if getattr(self, '_frozen', False):
+			raise AttributeError("LanguageResources is read-only")
+
+		object.__setattr__(self, name, value)
+
+
+	def __getattr__(self, name):
+
+		# вызывается, только если атрибута ещё нет, т.е. ресурсы не загружены
+		if name not in self.LAZY_ATTRIBUTES:
+			raise AttributeError(name)
+
+		self.load()
+
+		return object.__getattribute__(self, name)
+
+
+	def load(self):
+		"""
+		Загружает ресурсы, если они ещё не загружены. Атрибуты появляются
+		все сразу, поэтому другие потоки не увидят загруженные наполовину ресурсы.
+		"""
+
+		with self._lock:
+
+			if 'stopwords' in self.__dict__:
+				return
+
+			loadRes = LoadExternalLists()
+
+			loaded = {'irreg_verbs': {}, 'irreg_nouns': {}, 'suffix_trie_de': {}, 'lemmatizer_ru': None}
+
+			if self.language == 'de':
+				stopwords = loadRes.loadStopWordsDE()
+				# объект стеммера
+				loaded['stemmer'] = GermanStemmer()
+				# обращённое дерево словоформ немецкого словаря для поиска леммы по суффиксу
+				loaded['suffix_trie_de'] = loadRes.loadSuffixTrieDe()
+				print '\n', "Loading German Dictionary... OK", '\n'
+				loaded['normalizer'] = NormalizerDE(self.profile)
+			elif self.language == 'ru':
+				stopwords = loadRes.loadStopWordsRU()
+				loaded['stemmer'] = RussianStemmer()
+				# объект pymorphy2.MorphAnalyzer(), будем использовать атрибут normal_form
+				loaded['lemmatizer_ru'] = pymorphy2.MorphAnalyzer()
+				loaded['normalizer'] = NormalizerRU()
+			else:
+				stopwords = loadRes.loadStopWordsEN()
+				# стеммер без состояния: один объект можно вызывать из разных потоков
+				loaded['stemmer'] = StatelessPorterStemmer()
+				loaded['normalizer'] = NormalizerEN(self.profile)
+				# список неправ. гл.
+				loaded['irreg_verbs'] = loadRes.loadVerbForms()
+				# список неправ. сущ-х
+				loaded['irreg_nouns'] = loadRes.loadNounforms()
+
+			loaded['stopwords'] = frozenset(stopwords)
+
+			# этапы обработки токена по порядку: (название, функция), см. cleanToken и stemTerm.
+			# Названия этапов - ключи отчёта профилирования (PipelineStats)
+			normalizer = loaded['normalizer']
+			if self.language == 'de':
+				loaded['clean_stages'] = (('strip', self.stripToken), ('contractions', normalizer.deleteContrs), ('umlauts', normalizer.normalizeUmlaut))
+				loaded['stem_stages'] = (('lemmatize', functools.partial(normalizer.lemmatize, suffix_trie=loaded['suffix_trie_de'])), ('stem', loaded['stemmer'].stem))
+			elif self.language == 'ru':
+				loaded['clean_stages'] = (('strip', self.stripToken), ('yo', normalizer.normalizeE))
+				loaded['stem_stages'] = (('lemmatize', self.normalFormRU), ('stem', loaded['stemmer'].stem))
+			else:
+				loaded['clean_stages'] = (('strip', self.stripToken), ('contractions', normalizer.del_contractions), ('irregular', functools.partial(normalizer.token_transform, irreg_verbs=loaded['irreg_verbs'], irreg_nouns=loaded['irreg_nouns'])))
+				loaded['stem_stages'] = (('stem', loaded['stemmer'].stem),)
+
+			# проверка до очистки (см. isDroppedToken): drop_tokens - стоп-слова в том виде,
+			# в котором они встречаются в тексте, если очистка оставляет их стоп-словами,
+			# и пустой токен. drop_chars годится, только если неправильные формы en
+			# не превращают токен с цифрами или пустой токен в обычное слово
+			irregular = set(loaded['irreg_verbs']) | set(loaded['irreg_nouns'])
+			if '' in irregular or any(self.profile.esc_num.search(form) for form in irregular):
+				loaded['drop_chars'] = None
+			else:
+				loaded['drop_chars'] = self.profile.drop_chars
+
+			drop_tokens = set()
+			for word in loaded['stopwords'] | set(['']):
+				for token in (word, word.capitalize(), word.upper()):
+					term = token
+					for name, stage in loaded['clean_stages']:
+						term = stage(term)
+					if term in loaded['stopwords'] or self.profile.esc_num.search(term) is not None or len(term) == 0:
+						drop_tokens.add(token)
+			loaded['drop_tokens'] = frozenset(drop_tokens)
+
+			self.__dict__.update(loaded)
+
+
+	def stripToken(self, token):
+		"""
+		'Отрезаем' пунктуацию с концов слова, понижаем регистр.
+		"""
+
+		return token.strip(self.profile.punctuation).lower()
+
+
+	def normalFormRU(self, term):
+		"""
+		Нормальная форма русского слова по первому разбору pymorphy2.
+		"""
+
+		return self.lemmatizer_ru.parse(term)[0].normal_form
+
+
+	def isDropped(self, term):
+		"""
+		Стоп-слова, токены с цифрами и пустые токены не нужны.
+		"""
+
+		return term in self.stopwords or self.profile.esc_num.search(term) is not None or len(term) == 0
+
+
+	def isDroppedToken(self, token):
+		"""
+		Токен, который заведомо будет отброшен после очистки: стоп-слово как в тексте,
+		токен с цифрами или только из знаков пунктуации. Проверяется до clean_stages,
+		чтобы не очищать токены, которые всё равно не нужны. Если False, токен
+		может быть отброшен после очистки (isDropped).
+		"""
+
+		return token in self.drop_tokens or (self.drop_chars is not None and self.drop_chars.search(token) is not None)
+
+
+	def cleanToken(self, token):
+		"""
+		Этапы clean_stages: 'отрезаем' пунктуацию с концов слова, понижаем регистр,
+		удаляем окончания-сокращения, для de заменяем умлауты, для ru - ё,
+		для английского трансформируем неправильные формы.
+		Стоп-слова, токены с цифрами и пустые токены отбрасываются (возвращается None),
+		большая часть из них - ещё до очистки (см. isDroppedToken).
+		"""
+
+		if self.isDroppedToken(token):
+			return None
+
+		term = token
+		for name, stage in self.clean_stages:
+			term = stage(term)
+
+		if self.isDropped(term):
+			return None
+
+		return term
+
+
+	def stemTerm(self, term):
+		"""
+		Этапы stem_stages: стемма очищенного слова, для de - после лемматизации
+		по лексикону, для ru - стемма нормальной формы pymorphy2.
+		"""
+
+		for name, stage in self.stem_stages:
+			term = stage(term)
+
+		return term
+
+
+	def normalizeToken(self, token):
+		"""
+		Полная обработка одного токена: стемма или None для отброшенных токенов.
+		"""
+
+		term = self.cleanToken(token)
+
+		if term is None:
+			return None
+
+		return self.stemTerm(term)
 
-		loadRes = LoadExternalLists()
-
-		if self.language == 'de':
-			self.stopwords = loadRes.loadStopWordsDE()
-			# объект стеммера
-			self.stemmer = GermanStemmer()
-			# немецкий словарь
-			print '\n', "Loading German Dictionary... OK", '\n'
-			self.lexicon_de = loadRes.loadLexiconDe()
-			self.normalizer = NormalizerDE()
-		elif self.language == 'ru':
-			self.stopwords = loadRes.loadStopWordsRU()
-			self.stemmer = RussianStemmer()
-			# объект pymorphy2.MorphAnalyzer(), будем использовать атрибут normal_form
-			self.lemmatizer_ru = pymorphy2.MorphAnalyzer()
-			self.normalizer = NormalizerRU()
-		else:
-			self.stopwords = loadRes.loadStopWordsEN()
-			self.stemmer = PorterStemmer()
-			self.normalizer = NormalizerEN()
-			# список неправ. гл.
-			self.irreg_verbs = loadRes.loadVerbForms()
-			# список неправ. сущ-х
-			self.irreg_nouns = loadRes.loadNounforms()
-	
 
 	def processString(self, line):
 		"""
-		Функция последовательной обработки каждого слова. Получает на вход строку, создает список tokens,
-		складывает туда выделенные re.split'ом слова, 'отрезая' пунктуацию с концов слова и понижая регистр, 
-		и удаляет по ходу окончания-сокращения функцией del_contractions
-		Дальше переходит к формированию списка стеммированных терминов rslt_list с удалением стоп-слов
-		и цифровых последовательностей.
-		Возвращает список rslt_list, в котором содержатся только стеммы значимых слов.
+		Стеммы значимых слов строки (генератор), без кэша.
 		"""
 
-		# для разбивки на токены по пробелам и слешам
-		splitchars = re.compile(r'[\s\\\/\(\)\[\]\<\>\;\:\,\‚\—\?\!\|\"«»…#]|\.\.\.+|[ �⌂ ∞½¾►=]|\-\-|\.[\'\"’“”«»‘′″„-]') # [\.\:][\'\"’“”«»‘′″]
+		return (term for term in (self.normalizeToken(token) for token in self.profile.splitchars.split(line)) if term is not None)
 
-		# для игнорирования токенов, содержащих цифры
-		esc_num = re.compile(r'[0-9]+')
 
-		# для игнорирования URL
-		#url_esc = re.compile(r'([a-z]{3,6}:\/\/)?([a-zA-Z0-9\-@?]+[\.|\:])+[a-z]{2,13}[\.\?\=\&\%\,\#\+\(\)\/\w\-]*')
 
-				
-		if self.language == 'de':
-			tokens = (self.normalizer.normalizeUmlaut(self.normalizer.deleteContrs(token.strip(self.punctuation).lower())) for token in splitchars.split(line))
-			rslt_list = (self.stemmer.stem(self.normalizer.lemmatize(term, self.lexicon_de)) for term in tokens if term not in self.stopwords and not esc_num.search(term) and len(term)>0)	# and not esc_num.search(term) - включить после услоия на стоп-слова, если нужно удалять токены с цифрами
+class LRUCache(object):
 
-		elif self.language == 'ru':
-			tokens = (self.normalizer.normalizeE(token.strip(self.punctuation).lower()) for token in splitchars.split(line))
-			rslt_list = (self.stemmer.stem(self.lemmatizer_ru.parse(term)[0].normal_form) for term in tokens if term not in self.stopwords and not esc_num.search(term) and len(term)>0)	# and not esc_num.search(term) - включить после услоия на стоп-слова, если нужно удалять токены с цифрами
+	"""
+	Кэш ограниченного размера: при переполнении вытесняется запись,
+	к которой дольше всего не обращались. Считает попадания и промахи.
+	"""
 
-		else:
-			# генератор списка токенов: по циклу: разбиваем строку на токены по regexp splitchars,
-			# 2. удаляем знаки вокруг токена, приводим к нижнему регистру, 
-			# 3. трансформируем форму неправ. глаг. в правильную
-			# 4. удаляем окончания-сокращения с \'
-			tokens = (self.normalizer.token_transform(self.normalizer.del_contractions(token.strip(self.punctuation).lower()), self.irreg_verbs, self.irreg_nouns) for token in splitchars.split(line))
-
-			# генератор списка терминов: если термин не в списке стоп-слов и не содержит цифр, то стеммируем его.
-			rslt_list = (self.stemmer.stem(term, 0, len(term)-1) for term in tokens if term not in self.stopwords and not esc_num.search(term) and len(term)>0)	# and not esc_num.search(term) - включить после услоия на стоп-слова, если нужно удалять токены с цифрами
-		
+	def __init__(self, maxsize):
 
-		if not rslt_list:
-			return []
+		self.maxsize = maxsize
+		self.data = OrderedDict()
+		self.hits = 0
+		self.misses = 0
 
-		else:
-			return rslt_list
 
+	def lookup(self, key, compute):
+		"""
+		Возвращает значение для key из кэша, а если его там нет -
+		вычисляет compute(key) и запоминает результат.
+		"""
+
+		try:
+			value = self.data.pop(key)
+			self.hits += 1
+		except KeyError:
+			value = compute(key)
+			self.misses += 1
+			if len(self.data) >= self.maxsize:
+				self.data.popitem(last=False)
 
-	def processFile(self, filename):
+		# запись переставляется в конец как самая свежая
+		self.data[key] = value
+
+		return value
+
+
+
+class PipelineStats(object):
+
+	"""
+	Замеры для профилирования (--profile): суммарное время и число вызовов
+	каждого этапа обработки, попадания в кэш токенов и скорость обработки файлов.
+	Этапы документа (read - чтение и декодирование, split - нижний регистр
+	и разбивка на токены, normalize - обработка уникальных токенов через кэш)
+	делят время документа без пересечений. На проходах n-грамм длиной 2 и больше
+	(см. BuildTermSpace.crawlNgrams) время документа целиком - этап ngrams,
+	каждый такой проход по файлу - отдельная запись в files. Этапы токена (clean_stages, filter и stem_stages,
+	см. LanguageResources) вложены в normalize и вызываются только при промахе
+	кэша, для ru stem_stages - ещё и только при промахе таблицы форм.
+	Замеры ведёт BuildTermSpace, созданный с profile_report, без него этапы
+	вызываются напрямую, без таймеров.
+	"""
+
+	def __init__(self):
+
+		# этап -> [число вызовов, секунды]
+		self.document_stages = {}
+		self.token_stages = {}
+		# [путь, байты, токены, стеммы, секунды, длина n-грамм] для каждого прохода по файлу
+		self.files = []
+		self.cache_hits = 0
+		self.cache_misses = 0
+		# загрузка ресурсов языка (см. BuildTermSpace.profileStart)
+		self.load_seconds = 0.0
+		# токены текущего документа (см. BuildTermSpace.documentStems)
+		self.doc_tokens = 0
+
+
+	def addStage(self, stages, name, seconds, calls=1):
+
+		stage = stages.get(name)
+		if stage is None:
+			stage = stages[name] = [0, 0.0]
+		stage[0] += calls
+		stage[1] += seconds
+
+
+	def runStages(self, stages, value):
 		"""
-		Читает файл в utf-16, для каждой строки файла вызывает функцию processString,
-		каждое слово из получившегося списка добавляет в set terms_set, избавляясь от
-		дубликатов.
-		Возвращает список уникальных лемм.
+		Последовательно применяет к value функции этапов stages (пары (название, функция))
+		и замеряет каждую.
 		"""
 
-		terms_set = set()
-		terms_list = []
+		timer = timeit.default_timer
 
-		if self.action == 'tfidf':
-			try:
-				with codecs.open(filename, 'r', 'utf-16') as infile:
-					
-					for line in infile:
-						if len(line) > 1:
-							for term in self.processString(line):
-								terms_set.add(term)
-								
-			except (UnicodeDecodeError, UnicodeError, IOError):
-				pass
+		for name, stage in stages:
+			start = timer()
+			value = stage(value)
+			self.addStage(self.token_stages, name, timer() - start)
 
-			return terms_set
+		return value
 
-		if self.action == 'raw':
-			try:
-				with codecs.open(filename, 'r', 'utf-16') as infile:
-					
-					for line in infile:
-						if len(line) > 1:
-							for term in self.processString(line):
-								terms_list.append(term)
-								
-			except (UnicodeDecodeError, UnicodeError, IOError):
-				pass
 
-			return terms_list
+	def addFile(self, filename, size, stems_num, seconds, ngram=1):
+
+		self.files.append([filename, size, self.doc_tokens, stems_num, seconds, ngram])
+		self.doc_tokens = 0
 
 
-	def crawl(self, dirname):
+	def merge(self, other):
 		"""
-		Функция проходит по папкам и подпапкам указанной в качестве аргумента директории.
-		Проверяет, если файл текстовый, то запускает функцию processFile и складывает результат
-		её работы в set terms_set.
-		В общем terms_dict подсчитывается частотность каждой леммы, словарь сохраняется как json.
-		terms_dict отражает по сути вторую часть формулы tfidf, т.е. показывает в каком количестве
-		документов встретился термин.
+		Добавляет замеры другого объекта (например, из процесса пула).
 		"""
 
-		docs_num = 0
+		for stages, other_stages in ((self.document_stages, other.document_stages), (self.token_stages, other.token_stages)):
+			for name, (calls, seconds) in other_stages.iteritems():
+				self.addStage(stages, name, seconds, calls)
 
-		terms_dict = defaultdict(int)
-		
-		for root, dirs, files in os.walk(dirname):
+		self.files.extend(other.files)
+		self.cache_hits += other.cache_hits
+		self.cache_misses += other.cache_misses
 
-			print root, "processing..."
-			
-			for filename in files:
 
-				if filename.endswith('.txt') or filename.endswith('.TXT'):
-					
-					print filename
+	def report(self, **info):
+		"""
+		Отчёт в виде словаря для json: info (язык, действие и т.п.), этапы
+		с числом вызовов, временем и средним временем вызова в микросекундах,
+		доля попаданий в кэш, для каждого прохода по файлу и в сумме - байты и токены
+		в секунду. Токены считаются только на проходе основ (ngram 1), поэтому
+		токены в секунду в сумме - по времени этого прохода.
+		Время этапов при нескольких процессах суммируется по всем процессам.
+		"""
 
-					terms_set = self.processFile(join(root,filename))
+		def rate(amount, seconds):
+			return amount / seconds if seconds > 0 else None
 
-					for term in terms_set:
+		def stagesReport(stages):
+			return dict((name, {'calls': calls, 'seconds': seconds, 'us_per_call': 1000000 * seconds / calls if calls else None}) for name, (calls, seconds) in stages.iteritems())
 
-						terms_dict[term] += 1
+		files = []
+		total = {'files': 0, 'bytes': 0, 'tokens': 0, 'stems': 0, 'seconds': 0.0}
+		tokens_seconds = 0.0
 
-					docs_num+=1
-					
-		if self.action == 'raw':
-			with codecs.open(r'.\termSpace\\'+self.language.upper()+'frequency_list_stem.txt', 'w', 'utf-16') as outfile:
-				for key, value in sorted(terms_dict.iteritems(), key=lambda x:x[1], reverse=True):
-					outfile.write(key+'\t'+str(value))
-					outfile.write('\n')
-		
-		if self.action == 'tfidf':
+		for filename, size, tokens_num, stems_num, seconds, ngram in self.files:
+			if ngram == 1:
+				tokens_seconds += seconds
+			else:
+				tokens_num = None
+			files.append({'path': filename, 'ngram': ngram, 'bytes': size, 'tokens': tokens_num, 'stems': stems_num, 'seconds': seconds,
+				'bytes_per_sec': rate(size, seconds), 'tokens_per_sec': rate(tokens_num, seconds) if tokens_num is not None else None})
+			total['files'] += 1
+			total['bytes'] += size
+			total['tokens'] += tokens_num or 0
+			total['stems'] += stems_num
+			total['seconds'] += seconds
 
-			with open(r".\termSpace\\" + self.language.upper() + "CorpusDict_" + str(docs_num) + ".json", 'w') as  outfile:
-				json.dump(terms_dict, outfile)
+		total['bytes_per_sec'] = rate(total['bytes'], total['seconds'])
+		total['tokens_per_sec'] = rate(total['tokens'], tokens_seconds)
 
-		
+		lookups = self.cache_hits + self.cache_misses
 
+		result = dict(info)
+		result.update({
+			'document_stages': stagesReport(self.document_stages),
+			'token_stages': stagesReport(self.token_stages),
+			'load_seconds': self.load_seconds,
+			'token_cache': {'hits': self.cache_hits, 'misses': self.cache_misses, 'hit_rate': float(self.cache_hits) / lookups if lookups else None},
+			'files': files,
+			'total': total})
 
+		return result
 
-def main():
 
-	if len(sys.argv) != 4:
-		print '\n', 'Sctipt requires parameters!','\n'
-		print 'Usage: [script.py] [path_to_corpus] [en | de | ru] [tfidf | raw]'
-		sys.exit(1)
 
-	dir_path = sys.argv[1]
-	language = sys.argv[2]
-	# action = 1) tfidf = count stems for tfidf, 2) raw = count absolute freq. of each stem
-	action = sys.argv[3]
+class CorpusManifest(object):
+
+	"""
+	Манифест корпуса для инкрементальной сборки (BuildTermSpace.crawlIncremental).
+	Для каждого файла (путь относительно корпуса) хранит размер, время изменения,
+	хэш содержимого и вклад файла в словарь: список уникальных стемм для tfidf
+	или {стемма: частота} для raw и tfdf. Кроме того, хранит сам словарь terms,
+	к которому применяются изменения.
+	"""
+
+	def __init__(self, language, action):
+
+		self.language = language
+		self.action = action
+		self.files = {}
+		self.terms = {}
+
+
+	def load(self, filename):
+		"""
+		Загружает манифест, если он есть. Манифест другого языка или режима не подходит.
+		"""
+
+		if not os.path.exists(filename):
+			return
+
+		with open(filename, 'r') as infile:
+			data = json.load(infile)
+
+		if data['language'] != self.language or data['action'] != self.action:
+			raise ValueError("manifest %s was built for %s/%s" % (filename, data['language'], data['action']))
+
+		self.files = data['files']
+		self.terms = data['terms']
+
+
+	def save(self, filename):
+
+		with open(filename, 'w') as outfile:
+			json.dump({'language': self.language, 'action': self.action, 'files': self.files, 'terms': self.terms}, outfile, sort_keys=True)
+
+
+	def addFile(self, relpath, size, mtime, digest, doc_terms):
+		"""
+		Добавляет файл и его вклад в terms.
+		"""
+
+		if self.action == 'raw':
+			doc_terms = dict(doc_terms)
+			for term, count in doc_terms.iteritems():
+				self.terms[term] = self.terms.get(term, 0) + count
+		elif self.action == 'tfdf':
+			doc_terms = dict(doc_terms)
+			for term, count in doc_terms.iteritems():
+				self.terms[term] = self.terms.get(term, 0) + (count << TFDF_DOCS_BITS) + 1
+		else:
+			doc_terms = sorted(doc_terms)
+			for term in doc_terms:
+				self.terms[term] = self.terms.get(term, 0) + 1
+
+		self.files[relpath] = {'size': size, 'mtime': mtime, 'hash': digest, 'terms': doc_terms}
+
+
+	def removeFile(self, relpath):
+		"""
+		Удаляет файл и вычитает его вклад из terms, если файл был в манифесте.
+		"""
+
+		entry = self.files.pop(relpath, None)
+		if entry is None:
+			return
+
+		if self.action == 'raw':
+			doc_terms = entry['terms'].iteritems()
+		elif self.action == 'tfdf':
+			doc_terms = ((term, (count << TFDF_DOCS_BITS) + 1) for term, count in entry['terms'].iteritems())
+		else:
+			doc_terms = ((term, 1) for term in entry['terms'])
+
+		for term, count in doc_terms:
+			self.terms[term] -= count
+			if self.terms[term] == 0:
+				del self.terms[term]
+
+
+
+class TermSpaceAccumulator(object):
+
+	"""
+	Общий словарь частот основ, который копится по одному документу, отдельно
+	от обработки самих документов: для tfidf - в скольких документах встретилась
+	основа, для raw - сколько раз всего, для tfdf - и то и другое одним числом
+	(см. TFDF_DOCS_BITS). Результат - terms_dict и docs_num,
+	их сохраняет в файл BuildTermSpace.dumpAccumulator.
+	Если задан max_terms, в памяти держится не больше max_terms основ: когда
+	словарь дорастает до этого размера, он сбрасывается на диск отсортированным
+	по основе (spill) и начинается заново. Части потом сливаются (iterSorted,
+	iterByFrequency), результат тот же, что без ограничения. Временные файлы
+	лежат в отдельной папке внутри tmp_dir и удаляются в close.
+	Если вместо этого задан prune_terms, словарь не сбрасывается, а периодически
+	отсекаются редкие основы (см. prune): память ограничена без диска, но частоты
+	приближённые - занижены не больше чем на prune_floor. Только для tfidf и raw.
+	"""
+
+	# сколько частей сливать в одну при сбросе, чтобы не держать открытыми слишком много файлов
+	MERGE_RUNS = 64
+
+	def __init__(self, action='tfidf', max_terms=None, tmp_dir=None, prune_terms=None):
+
+		if prune_terms is not None and (max_terms is not None or action not in ('tfidf', 'raw')):
+			raise ValueError("prune_terms is supported for tfidf and raw only and can't be combined with max_terms")
+
+		self.action = action
+		self.terms_dict = defaultdict(int)
+		self.docs_num = 0
+
+		self.max_terms = max_terms
+		self.tmp_dir = tmp_dir
+		# папка для частей и отсортированные по основе части, сброшенные на диск
+		self.runs_dir = None
+		self.runs = []
+
+		# порог отсечения и возможная ошибка частоты основ, добавленных после отсечения
+		self.prune_terms = prune_terms
+		self.prune_floor = 0
+		self.prune_errors = {}
+
+
+	def addStems(self, stems):
+		"""
+		Добавляет документ по его основам (список или любая итерируемая последовательность).
+		"""
+
+		if self.action in ('raw', 'tfdf'):
+			self.addCounts(Counter(stems))
+		else:
+			self.addCounts(set(stems))
+
+
+	def addCounts(self, doc_terms):
+		"""
+		Добавляет документ в виде результата BuildTermSpace.countFile:
+		set основ для tfidf, Counter основ для raw и tfdf.
+		"""
+
+		terms_dict = self.terms_dict
+
+		if self.prune_floor:
+			# основа могла быть отсечена раньше: её частота до этого не больше порога
+			for term in doc_terms:
+				if term not in terms_dict:
+					self.prune_errors[term] = self.prune_floor
+
+		if self.action == 'raw':
+			for term, count in doc_terms.iteritems():
+				terms_dict[term] += count
+		elif self.action == 'tfdf':
+			# частота и один документ одним числом
+			for term, count in doc_terms.iteritems():
+				terms_dict[term] += (count << TFDF_DOCS_BITS) + 1
+		else:
+			for term in doc_terms:
+				terms_dict[term] += 1
+
+		self.docs_num += 1
+
+		if self.max_terms is not None and len(terms_dict) >= self.max_terms:
+			self.spill()
+
+		if self.prune_terms is not None and len(terms_dict) >= self.prune_terms:
+			self.prune()
+
+
+	def prune(self):
+		"""
+		Отсечение редких основ (lossy counting): порог prune_floor поднимается так,
+		чтобы после удаления основ, у которых частота вместе с возможной ошибкой
+		не больше порога, в словаре осталось не больше половины prune_terms.
+		Удалённая основа, встреченная снова, считается заново, а её ошибка - порог
+		на этот момент: настоящая частота основы не меньше частоты в словаре
+		и не больше частоты плюс ошибка. Частые основы поэтому не теряются.
+		"""
+
+		errors = self.prune_errors
+		bounds = sorted(count + errors.get(term, 0) for term, count in self.terms_dict.iteritems())
+		self.prune_floor = max(self.prune_floor, bounds[len(bounds) - self.prune_terms // 2 - 1])
+
+		floor = self.prune_floor
+		self.terms_dict = defaultdict(int, ((term, count) for term, count in self.terms_dict.iteritems() if count + errors.get(term, 0) > floor))
+		self.prune_errors = dict((term, error) for term, error in errors.iteritems() if term in self.terms_dict)
+
+
+	def spill(self):
+		"""
+		Сбрасывает словарь из памяти на диск отсортированным по основе.
+		"""
+
+		if self.runs_dir is None:
+			self.runs_dir = tempfile.mkdtemp(prefix='termspace', dir=self.tmp_dir)
+
+		self.runs.append(writeRun(sorted(self.terms_dict.iteritems()), self.runs_dir))
+		self.terms_dict = defaultdict(int)
+
+		if len(self.runs) >= self.MERGE_RUNS:
+			merged = writeRun(sumSortedCounts(heapq.merge(*[readRun(path) for path in self.runs])), self.runs_dir)
+			for path in self.runs:
+				os.remove(path)
+			self.runs = [merged]
+
+
+	def iterSorted(self):
+		"""
+		Все пары (основа, частота) по возрастанию основы, частоты сложены
+		по частям на диске и словарю в памяти.
+		"""
+
+		if not self.runs:
+			return iter(sorted(self.terms_dict.iteritems()))
+
+		return sumSortedCounts(heapq.merge(*([readRun(path) for path in self.runs] + [sorted(self.terms_dict.iteritems())])))
+
+
+	def iterByFrequency(self):
+		"""
+		Все пары (основа, частота) в порядке частотного списка: по убыванию частоты,
+		затем по основе. Если словарь сбрасывался на диск, сортировка тоже внешняя:
+		слитый по основе поток режется на куски по max_terms, они сортируются
+		по частоте, сбрасываются и сливаются.
+		"""
+
+		if not self.runs:
+			return iter(sorted(self.terms_dict.iteritems(), key=lambda x:(-x[1], x[0])))
+
+		frequency_runs = []
+		chunk = []
+
+		for item in self.iterSorted():
+			chunk.append(item)
+			if len(chunk) >= self.max_terms:
+				frequency_runs.append(writeRun(sorted(chunk, key=lambda x:(-x[1], x[0])), self.runs_dir))
+				chunk = []
+
+		frequency_runs.append(writeRun(sorted(chunk, key=lambda x:(-x[1], x[0])), self.runs_dir))
+
+		# heapq.merge без key, поэтому сливаются пары (-частота, основа)
+		merged = heapq.merge(*[((-count, term) for term, count in readRun(path)) for path in frequency_runs])
+
+		return ((term, -count) for count, term in merged)
+
+
+	def close(self):
+		"""
+		Удаляет временные файлы.
+		"""
+
+		if self.runs_dir is not None:
+			shutil.rmtree(self.runs_dir, ignore_errors=True)
+			self.runs_dir = None
+			self.runs = []
+
+
+
+class TermSpaceShards(TermSpaceAccumulator):
+
+	"""
+	Слияние шардов (см. BuildTermSpace.writeShard): TermSpaceAccumulator, у которого
+	вместо сброшенных на диск частей - файлы шардов. Шарды отсортированы по основе
+	и сливаются потоком (k-way, heapq.merge), docs_num - сумма docs_num шардов,
+	так что результат сохраняет BuildTermSpace.dumpAccumulator в любом формате.
+	Сливаются только шарды одного языка, действия, n-грамм и версии обработки,
+	без отсечения по min_df: у отсечённых основ частоты в шарде потеряны.
+	"""
+
+	def __init__(self, paths, max_terms=1000000, tmp_dir=None):
+
+		if not paths:
+			raise ValueError("no shards to merge")
+
+		headers = [readShardHeader(path) for path in paths]
+		first = headers[0]
+
+		for path, header in zip(paths, headers):
+			for key in ('pipeline', 'language', 'action', 'ngram_max'):
+				if header[key] != first[key]:
+					raise ValueError("shard %s: %s %s, expected %s" % (path, key, header[key], first[key]))
+			if minDfPrunes(header['min_df']):
+				raise ValueError("shard %s was pruned with min_df %s and can't be merged" % (path, header['min_df']))
+
+		# max_terms - размер кусков при внешней сортировке по частоте (iterByFrequency)
+		TermSpaceAccumulator.__init__(self, first['action'], max_terms, tmp_dir)
+
+		self.language = first['language']
+		self.ngram_max = first['ngram_max']
+		self.docs_num = sum(header['docs_num'] for header in headers)
+		self.runs = list(paths)
+		self.runs_dir = tempfile.mkdtemp(prefix='termspace', dir=tmp_dir)
+
+
+	def iterSorted(self):
+
+		return sumSortedCounts(heapq.merge(*[readShard(path) for path in self.runs]))
+
+
+
+class ApproxTermCounter(object):
+
+	"""
+	Приближённый подсчёт числа документов с основой (действие approx) в памяти,
+	которая не зависит от размера словаря. Два компонента:
+	Count-Min Sketch - таблица depth x width счётчиков (массив NumPy), основа
+	увеличивает по одному счётчику в каждой строке, оценка - минимум из них.
+	Оценка не меньше точной и с вероятностью 1 - delta больше неё не более
+	чем на epsilon * N, где N - сумма всех добавленных частот.
+	width = e / epsilon, depth = ln(1 / delta).
+	Space-Saving - таблица из capacity основ-кандидатов в самые частые: новая основа
+	при заполненной таблице вытесняет основу с наименьшим счётчиком и наследует
+	его. Все основы с частотой больше N / capacity в таблице гарантированно есть.
+	В результат попадают основы таблицы Space-Saving с меньшей из двух оценок.
+	Интерфейс как у TermSpaceAccumulator: addCounts, addStems, docs_num, close.
+	"""
+
+	# сколько ячеек скетча копится перед сложением в таблицу одним numpy.bincount
+	FLUSH_CELLS = 1000000
+
+	def __init__(self, epsilon=0.00001, delta=0.01, capacity=10000):
+
+		if numpy is None:
+			raise ImportError("ApproxTermCounter requires numpy")
+
+		self.epsilon = epsilon
+		self.delta = delta
+		self.capacity = capacity
+		self.docs_num = 0
+
+		self.width = int(math.ceil(math.e / epsilon))
+		self.depth = int(math.ceil(math.log(1.0 / delta)))
+		self.table = numpy.zeros(self.depth * self.width, dtype=numpy.int64)
+		self.row_offsets = (numpy.arange(self.depth, dtype=numpy.int64) * self.width)[:, None]
+		self.pending = []
+		self.pending_cells = 0
+
+		# Space-Saving: основа -> счётчик и куча (счётчик, основа) с устаревшими
+		# записями, которые пропускаются при извлечении минимума
+		self.counts = {}
+		self.heap = []
+
+
+	def cells(self, terms):
+		"""
+		Номера ячеек скетча (в плоской таблице) для списка основ: массив depth x len(terms).
+		Столбец в строке i - (h1 + i * h2) mod width, h1 и h2 - две половины md5 основы,
+		так что результат не зависит от платформы и запуска.
+		"""
+
+		digests = numpy.frombuffer(b''.join(hashlib.md5(term.encode('utf-8')).digest() for term in terms), dtype=numpy.dtype(b'<u8')).reshape(-1, 2)
+		rows = numpy.arange(self.depth, dtype=numpy.uint64)[:, None]
+		columns = (digests[:, 0] + rows * digests[:, 1]) % numpy.uint64(self.width)
+
+		return columns.astype(numpy.int64) + self.row_offsets
+
+
+	def flush(self):
+
+		if self.pending:
+			self.table += numpy.bincount(numpy.concatenate([cells.ravel() for cells in self.pending]), minlength=len(self.table))
+			self.pending = []
+			self.pending_cells = 0
+
+
+	def estimate(self, terms):
+		"""
+		Оценки Count-Min Sketch для списка основ.
+		"""
+
+		self.flush()
+
+		if not terms:
+			return []
+
+		return self.table[self.cells(terms)].min(axis=0).tolist()
+
+
+	def addStems(self, stems):
+
+		self.addCounts(set(stems))
+
+
+	def addCounts(self, doc_terms):
+		"""
+		Добавляет документ в виде set основ (результат BuildTermSpace.countFile).
+		"""
+
+		terms = list(doc_terms)
+
+		if terms:
+			cells = self.cells(terms)
+			self.pending.append(cells)
+			self.pending_cells += cells.size
+			if self.pending_cells >= self.FLUSH_CELLS:
+				self.flush()
+
+		counts = self.counts
+		heap = self.heap
+
+		for term in terms:
+			count = counts.get(term)
+			if count is not None:
+				count += 1
+			elif len(counts) < self.capacity:
+				count = 1
+			else:
+				# вытесняется основа с наименьшим счётчиком, новая наследует его
+				while True:
+					min_count, min_term = heapq.heappop(heap)
+					if counts.get(min_term) == min_count:
+						break
+				del counts[min_term]
+				count = min_count + 1
+			counts[term] = count
+			heapq.heappush(heap, (count, term))
+
+		# куча пересобирается, чтобы устаревшие записи не занимали память
+		if len(heap) > 4 * self.capacity:
+			self.heap = [(count, term) for term, count in counts.iteritems()]
+			heapq.heapify(self.heap)
+
+		self.docs_num += 1
+
+
+	def iterByFrequency(self):
+		"""
+		Основы таблицы Space-Saving в порядке частотного списка: по убыванию
+		оценки, затем по основе.
+		"""
+
+		terms = sorted(self.counts)
+		items = [(term, min(sketch_count, self.counts[term])) for term, sketch_count in zip(terms, self.estimate(terms))]
+
+		return iter(sorted(items, key=lambda x:(-x[1], x[0])))
+
+
+	def close(self):
+
+		pass
+
+
+
+class TfidfVectorizer(object):
+
+	"""
+	Векторизация документов по tf-idf на основе готового словаря CorpusDict
+	(результат crawl в режиме tfidf) и того же конвейера обработки, что и при
+	его построении (BuildTermSpace.processString).
+	Каждой основе словаря соответствует столбец (основы отсортированы), idf = log(docs_num / df).
+	Результат - разреженная матрица в формате CSR из трёх массивов NumPy:
+	data (веса), indices (столбцы), indptr (границы строк), как в конструкторе
+	scipy.sparse.csr_matrix((data, indices, indptr), shape).
+	Основы, которых нет в словаре, не учитываются.
+	"""
+
+	def __init__(self, builder, terms_dict, docs_num, normalize=True):
+
+		if numpy is None:
+			raise ImportError("TfidfVectorizer requires numpy")
+
+		self.builder = builder
+		self.normalize = normalize
+		self.docs_num = docs_num
+
+		self.stems = sorted(terms_dict)
+		self.columns = dict((stem, column) for column, stem in enumerate(self.stems))
+
+		df = numpy.array([terms_dict[stem] for stem in self.stems], dtype=numpy.float64)
+		self.idf = numpy.log(docs_num / df)
+
+
+	@classmethod
+	def fromFile(cls, builder, filename, normalize=True):
+		"""
+		Загружает словарь из CorpusDict_<docs_num>.json или из двоичного .tsb (см. BinaryTermSpace).
+		Словарь должен быть построен в режиме tfidf: частоты raw - не число документов.
+		"""
+
+		if filename.endswith('.tsb'):
+			with BinaryTermSpace(filename) as term_space:
+				if term_space.action != 'tfidf':
+					raise ValueError("%s is a '%s' term space, tf-idf needs 'tfidf'" % (filename, term_space.action))
+				return cls(builder, dict(term_space.iteritems()), term_space.docs_num, normalize)
+
+		match = re.search(r'CorpusDict_(\d+)\.json$', filename)
+		if match is None:
+			raise ValueError("%s is not a tfidf term space: expected <LANG>CorpusDict_<docs_num>.json or .tsb" % filename)
+
+		docs_num = int(match.group(1))
+		with open(filename, 'r') as infile:
+			return cls(builder, json.load(infile), docs_num, normalize)
+
+
+	def transformStems(self, docs_stems):
+		"""
+		Основной проход: docs_stems - последовательность итерируемых основ документов.
+		Столбцы и частоты копятся в плоских array, в NumPy переводятся один раз в конце.
+		Возвращает (data, indices, indptr).
+		"""
+
+		columns = self.columns
+		indices = array('l')
+		counts = array('d')
+		indptr = array('l', [0])
+
+		for stems in docs_stems:
+			doc_counts = Counter(columns[stem] for stem in stems if stem in columns)
+			for column in sorted(doc_counts):
+				indices.append(column)
+				counts.append(doc_counts[column])
+			indptr.append(len(indices))
+
+		indices = numpy.frombuffer(indices, dtype=numpy.dtype(b'l')).astype(numpy.int64)
+		indptr = numpy.frombuffer(indptr, dtype=numpy.dtype(b'l')).astype(numpy.int64)
+		data = numpy.frombuffer(counts, dtype=numpy.float64) * self.idf[indices]
+
+		if self.normalize and len(data):
+			rows = numpy.repeat(numpy.arange(len(indptr) - 1), numpy.diff(indptr))
+			norms = numpy.sqrt(numpy.bincount(rows, weights=data * data))
+			norms[norms == 0] = 1.0
+			data /= norms[rows]
+
+		return data, indices, indptr
+
+
+	def transform(self, texts):
+		"""
+		Векторизует тексты (строки unicode). Тексты разбиваются на строки так же,
+		как при чтении файла в processFile.
+		"""
+
+		return self.transformStems(self.builder.textStems(text) for text in texts)
+
+
+	def transformFiles(self, filenames):
+		"""
+		Векторизует файлы, читая их через DocumentReader построителя.
+		"""
+
+		return self.transformStems(self.builder.linesStems(self.builder.reader.iterLines(filename)) for filename in filenames)
+
+
+
+class BinaryTermSpace(object):
+
+	"""
+	Компактный двоичный формат словаря основ и чтение из него без загрузки целиком.
+	Устройство файла (все числа little-endian):
+	заголовок HEADER - сигнатура, версия, язык, режим (tfidf/raw), docs_num, число основ n;
+	n+1 смещений (uint64) начала каждой основы в таблице строк;
+	n частот (uint64);
+	таблица строк - основы в utf-8 подряд, отсортированные по байтам.
+	Файл открывается через mmap, основа ищется двоичным поиском,
+	так что в память попадают только прочитанные страницы.
+	"""
+
+	MAGIC = b'TSPC'
+	VERSION = 1
+	HEADER = struct.Struct(b'<4sHH8s8sQQ')
+
+	def __init__(self, filename):
+
+		self.infile = open(filename, 'rb')
+		self.data = mmap.mmap(self.infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, version, reserved, language, action, docs_num, terms_num = self.HEADER.unpack_from(self.data, 0)
+		if magic != self.MAGIC or version != self.VERSION:
+			self.close()
+			raise ValueError("%s is not a binary term space (version %d)" % (filename, self.VERSION))
+
+		self.language = language.rstrip(b'\x00').decode('ascii')
+		self.action = action.rstrip(b'\x00').decode('ascii')
+		self.docs_num = docs_num
+		self.terms_num = terms_num
+
+		self.offsets_pos = self.HEADER.size
+		self.counts_pos = self.offsets_pos + 8 * (terms_num + 1)
+		self.strings_pos = self.counts_pos + 8 * terms_num
+
+
+	@classmethod
+	def write(cls, filename, terms_dict, docs_num, language, action):
+		"""
+		Записывает словарь terms_dict {основа: частота} в двоичном формате.
+		"""
+
+		items = sorted((term.encode('utf-8'), count) for term, count in terms_dict.iteritems())
+
+		offsets = [0]
+		for term, count in items:
+			offsets.append(offsets[-1] + len(term))
+
+		with open(filename, 'wb') as outfile:
+			outfile.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, 0, language.encode('ascii'), action.encode('ascii'), docs_num, len(items)))
+			outfile.write(struct.pack(b'<%dQ' % len(offsets), *offsets))
+			outfile.write(struct.pack(b'<%dQ' % len(items), *[count for term, count in items]))
+			for term, count in items:
+				outfile.write(term)
+
+
+	def stemAt(self, i):
+
+		start, end = struct.unpack_from(b'<QQ', self.data, self.offsets_pos + 8 * i)
+		return self.data[self.strings_pos+start:self.strings_pos+end]
+
+
+	def countAt(self, i):
+
+		return struct.unpack_from(b'<Q', self.data, self.counts_pos + 8 * i)[0]
+
+
+	def get(self, term, default=None):
+		"""
+		Частота основы term или default, если основы нет. Двоичный поиск по таблице строк.
+		"""
+
+		key = term.encode('utf-8')
+		lo, hi = 0, self.terms_num
+
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.stemAt(mid) < key:
+				lo = mid + 1
+			else:
+				hi = mid
+
+		if lo < self.terms_num and self.stemAt(lo) == key:
+			return self.countAt(lo)
+
+		return default
+
+
+	def __getitem__(self, term):
+
+		count = self.get(term)
+		if count is None:
+			raise KeyError(term)
+		return count
+
+
+	def __contains__(self, term):
+
+		return self.get(term) is not None
+
+
+	def __len__(self):
+
+		return self.terms_num
+
+
+	def iteritems(self):
+		"""
+		Все пары (основа, частота) в порядке таблицы строк.
+		"""
+
+		for i in xrange(self.terms_num):
+			yield self.stemAt(i).decode('utf-8'), self.countAt(i)
+
+
+	def close(self):
+
+		self.data.close()
+		self.infile.close()
+
+
+	def __enter__(self):
+
+		return self
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+
+		self.close()
+
+
+
+class BuildTermSpace(object):
+
+	"""
+	Создание json-объекта в виде словаря, в котором хранятся стеммы
+	значимых слов и их частотность из указанных корпусов.
+	"""
+
+	def __init__(self, language='en', action='tfidf', cache_size=100000, reader=None, output_format='json', lemma_table=None, resources=None, output_dir=None, max_terms=None, tmp_dir=None, approx_epsilon=0.00001, approx_delta=0.01, heavy_hitters=10000, profile_report=None, ngram_max=1, min_df=1, pmi=False, max_df=None, top_k=None, prune_terms=None, prefetcher=None):
+
+		# Ресурсы языка (стоп-слова, лексикон, стеммер) берутся из LanguageResources,
+		# его можно передать готовым, чтобы несколько построителей делили один объект
+		# 
+		self.language = language
+		self.action = action
+		self.cache_size = cache_size
+		# json (частотный список для raw) или binary (см. BinaryTermSpace)
+		self.output_format = output_format
+		# папка для результатов, None - .\termSpace\ как раньше (см. outputPath)
+		self.output_dir = output_dir
+		# ограничение числа основ в памяти при подсчёте и папка для сброса (см. TermSpaceAccumulator)
+		self.max_terms = max_terms
+		self.tmp_dir = tmp_dir
+		# точность и размер таблицы самых частых основ для approx (см. ApproxTermCounter)
+		self.approx_epsilon = approx_epsilon
+		self.approx_delta = approx_delta
+		self.heavy_hitters = heavy_hitters
+		# файл json-отчёта профилирования, None - замеры не ведутся (см. PipelineStats)
+		self.profile_report = profile_report
+		self.stats = PipelineStats() if profile_report is not None else None
+		# n-граммы основ до длины ngram_max, pmi - сохранить коллокации с PMI (см. crawlNgrams)
+		self.ngram_max = ngram_max
+		self.pmi = pmi
+		# отсечение при сохранении (см. iterPruned): основы не меньше чем из min_df
+		# и не больше чем из max_df документов (для raw - частота; int - число,
+		# float - доля от docs_num), top_k - только top_k самых частых, None - без ограничения
+		self.min_df = min_df
+		self.max_df = max_df
+		self.top_k = top_k
+		# приближённый подсчёт с отсечением редких основ в памяти (см. TermSpaceAccumulator.prune)
+		self.prune_terms = prune_terms
+		# (n, допустимые (n-1)-граммы) на текущем проходе crawlNgrams, None - обычный подсчёт
+		self.ngram_level = None
+
+		# кэш токен -> стемма (None для отброшенных токенов), cache_size = 0 отключает кэш
+		if cache_size > 0:
+			self.token_cache = LRUCache(cache_size)
+		else:
+			self.token_cache = None
+
+		# чтение документов: блоками, с определением кодировки
+		if reader is None:
+			reader = DocumentReader()
+		self.reader = reader
+		# упреждающее чтение файлов корпуса (см. FilePrefetcher), None - файлы читаются по одному
+		self.prefetcher = prefetcher
+
+		if resources is None:
+			resources = sharedResources(language)
+		elif resources.language != language:
+			raise ValueError("resources are loaded for '%s', not for '%s'" % (resources.language, language))
+		self.resources = resources
+		self.profile = resources.profile
+
+		# для ru: таблица форма -> стемма, которая сохраняется в файл lemma_table
+		# между запусками, new_lemmas_ru - формы, разобранные pymorphy2 в этом запуске
+		self.lemma_table_path = lemma_table
+		self.lemma_table_ru = {}
+		self.new_lemmas_ru = {}
+
+		if self.language == 'ru' and self.lemma_table_path is not None:
+			self.lemma_table_ru = LoadExternalLists().loadLemmaTableRU(self.lemma_table_path)
+	
+
+	def processString(self, line):
+		"""
+		Функция последовательной обработки каждого слова. Получает на вход строку,
+		разбивает её re.split'ом на токены и каждый токен прогоняет через normalizeToken.
+		Результат normalizeToken для токена берётся из кэша token_cache, если он там есть:
+		слова в тексте повторяются, а полная обработка (особенно лемматизация) дорогая.
+		Возвращает генератор, в котором содержатся только стеммы значимых слов.
+		"""
+
+		splitchars = self.profile.splitchars
+
+		if self.token_cache is None:
+			rslt_list = (self.normalizeToken(token) for token in splitchars.split(line))
+		else:
+			rslt_list = (self.token_cache.lookup(token, self.normalizeToken) for token in splitchars.split(line))
+
+		return (term for term in rslt_list if term is not None)
+
+
+	def normalizeToken(self, token):
+		"""
+		Полная обработка одного токена (см. LanguageResources.cleanToken и stemTerm):
+		стемма или None для отброшенных токенов. Для ru стемма берётся из таблицы форм.
+		"""
+
+		term = self.cleanToken(token)
+
+		if term is None:
+			return None
+
+		if self.language == 'ru':
+			return self.lemmaStemRU(term)
+
+		return self.stemTerm(term)
+
+
+	def cleanToken(self, token):
+		"""
+		LanguageResources.cleanToken, при профилировании - с замером каждого этапа.
+		"""
+
+		if self.stats is None:
+			return self.resources.cleanToken(token)
+
+		start = timeit.default_timer()
+		dropped = self.resources.isDroppedToken(token)
+		self.stats.addStage(self.stats.token_stages, 'prefilter', timeit.default_timer() - start)
+
+		if dropped:
+			return None
+
+		term = self.stats.runStages(self.resources.clean_stages, token)
+
+		start = timeit.default_timer()
+		dropped = self.resources.isDropped(term)
+		self.stats.addStage(self.stats.token_stages, 'filter', timeit.default_timer() - start)
+
+		if dropped:
+			return None
+
+		return term
+
+
+	def stemTerm(self, term):
+		"""
+		LanguageResources.stemTerm, при профилировании - с замером каждого этапа.
+		"""
+
+		if self.stats is None:
+			return self.resources.stemTerm(term)
+
+		return self.stats.runStages(self.resources.stem_stages, term)
+
+
+	def lemmaStemRU(self, term):
+		"""
+		Стемма нормальной формы русского слова. Сначала ищется в таблице lemma_table_ru,
+		pymorphy2 вызывается только для новых форм. Если таблица сохраняется в файл,
+		новые формы запоминаются в ней.
+		"""
+
+		stem = self.lemma_table_ru.get(term)
+
+		if stem is None:
+			stem = self.stemTerm(term)
+			if self.lemma_table_path is not None:
+				self.lemma_table_ru[term] = stem
+				self.new_lemmas_ru[term] = stem
+
+		return stem
+
+
+	def takeNewLemmas(self):
+		"""
+		Отдаёт формы, разобранные pymorphy2 с прошлого вызова (для передачи из процессов пула).
+		"""
+
+		new_lemmas = self.new_lemmas_ru
+		self.new_lemmas_ru = {}
+		return new_lemmas
+
+
+	def saveLemmaTable(self):
+		"""
+		Сохраняет таблицу форма -> стемма, если в ней появились новые формы.
+		"""
+
+		if self.lemma_table_path is None or not self.new_lemmas_ru:
+			return
+
+		LoadExternalLists().saveLemmaTableRU(self.lemma_table_path, self.lemma_table_ru)
+		print "Lemma table: %d forms, %d new" % (len(self.lemma_table_ru), len(self.new_lemmas_ru))
+		self.new_lemmas_ru = {}
+
+
+	def takeStats(self):
+		"""
+		Отдаёт замеры с прошлого вызова (для передачи из процессов пула), None без профилирования.
+		"""
+
+		stats = self.stats
+		if stats is not None:
+			self.stats = PipelineStats()
+		return stats
+
+
+	def profileStart(self):
+		"""
+		Начало обхода корпуса: время для отчёта профилирования. При профилировании
+		ресурсы языка загружаются здесь, чтобы загрузка не попала в этапы первого документа.
+		"""
+
+		start = timeit.default_timer()
+
+		if self.stats is not None:
+			self.resources.load()
+			self.stats.load_seconds += timeit.default_timer() - start
+
+		return start
+
+
+	def writeProfileReport(self, wall_seconds, workers=1):
+		"""
+		Сохраняет отчёт профилирования в profile_report (см. PipelineStats.report).
+		"""
+
+		if self.stats is None:
+			return
+
+		report = self.stats.report(language=self.language, action=self.action, workers=workers, wall_seconds=wall_seconds)
+
+		with open(self.profile_report, 'w') as outfile:
+			json.dump(report, outfile, sort_keys=True, indent=1)
+
+		print "Profile report:", self.profile_report
+
+
+	@property
+	def cache_hits(self):
+		"""Сколько раз результат обработки токена был взят из кэша."""
+
+		if self.token_cache is None:
+			return 0
+		return self.token_cache.hits
+
+
+	@property
+	def cache_misses(self):
+		"""Сколько раз токен пришлось обрабатывать полностью."""
+
+		if self.token_cache is None:
+			return 0
+		return self.token_cache.misses
+
+
+
+	def linesStems(self, lines):
+		"""
+		Генератор основ значимых слов по строкам документа, пустые строки пропускаются.
+		"""
+
+		for line in lines:
+			if len(line) > 1:
+				for term in self.processString(line):
+					yield term
+
+
+	def textStems(self, text):
+		"""
+		То же для документа, целиком переданного строкой unicode: текст разбивается
+		на строки так же, как при чтении файла.
+		"""
+
+		return self.linesStems(text.splitlines(True))
+
+
+	def documentStems(self, lines, batch_size=1048576):
+		"""
+		Пакетная обработка документа: Counter стемм, тот же, что Counter(linesStems(lines)).
+		Строки склеиваются в блоки примерно по batch_size символов, блок целиком
+		переводится в нижний регистр и разбивается на токены одним вызовом splitchars.split,
+		токены считаются в словаре. normalizeToken (через кэш) вызывается только
+		для уникальных токенов документа, их стеммы получают частоты токенов.
+		Так на каждое вхождение токена приходится одна операция со словарём,
+		а не разбор строки, strip, регулярные выражения и обращение к кэшу.
+		Порядок стемм при этом теряется, поэтому processIter использует linesStems.
+		"""
+
+		splitchars = self.profile.splitchars
+		tokens = defaultdict(int)
+		batch = []
+		batch_len = 0
+
+		# при профилировании время разбивки замеряется по блокам, остальное время
+		# цикла по строкам - чтение документа
+		stats = self.stats
+		if stats is not None:
+			timer = timeit.default_timer
+			start = timer()
+			split_seconds = 0.0
+			batches_num = 0
+
+		for line in lines:
+			# короткие строки пропускаются, как в linesStems
+			if len(line) > 1:
+				batch.append(line)
+				batch_len += len(line)
+			if batch_len >= batch_size:
+				if stats is not None:
+					split_start = timer()
+				# '\n' между строками: граница строки всегда разделяет токены
+				for token in splitchars.split('\n'.join(batch).lower()):
+					tokens[token] += 1
+				batch = []
+				batch_len = 0
+				if stats is not None:
+					split_seconds += timer() - split_start
+					batches_num += 1
+
+		if stats is not None:
+			read_seconds = timer() - start - split_seconds
+			split_start = timer()
+
+		if batch:
+			for token in splitchars.split('\n'.join(batch).lower()):
+				tokens[token] += 1
+
+		if stats is not None:
+			split_seconds += timer() - split_start
+			batches_num += 1
+			stats.addStage(stats.document_stages, 'read', read_seconds)
+			stats.addStage(stats.document_stages, 'split', split_seconds, batches_num)
+			# пустые строки между разделителями - не токены
+			stats.doc_tokens += sum(tokens.itervalues()) - tokens.get('', 0)
+			normalize_start = timer()
+			if self.token_cache is not None:
+				hits, misses = self.token_cache.hits, self.token_cache.misses
+
+		stems = Counter()
+
+		for token, count in tokens.iteritems():
+			if self.token_cache is None:
+				stem = self.normalizeToken(token)
+			else:
+				stem = self.token_cache.lookup(token, self.normalizeToken)
+			if stem is not None:
+				stems[stem] += count
+
+		if stats is not None:
+			stats.addStage(stats.document_stages, 'normalize', timer() - normalize_start, len(tokens))
+			if self.token_cache is not None:
+				stats.cache_hits += self.token_cache.hits - hits
+				stats.cache_misses += self.token_cache.misses - misses
+
+		return stems
+
+
+	def documentNgrams(self, lines, n, frequent=None):
+		"""
+		Counter n-грамм документа: n основ подряд из processString одной строки,
+		через пробел. Стоп-слова и прочие отброшенные токены из потока основ уже
+		удалены, поэтому n-грамма может их перешагивать, а границу строки - нет.
+		Если задано frequent, учитываются только n-граммы, у которых и первые,
+		и последние n-1 основ есть в frequent.
+		"""
+
+		grams = Counter()
+
+		for line in lines:
+			if len(line) > 1:
+				stems = list(self.processString(line))
+				for i in xrange(len(stems) - n + 1):
+					if frequent is None or (' '.join(stems[i:i+n-1]) in frequent and ' '.join(stems[i+1:i+n]) in frequent):
+						grams[' '.join(stems[i:i+n])] += 1
+
+		return grams
+
+
+	def processIter(self, documents):
+		"""
+		Обработка документов, которые приходят не из файлов (очередь сообщений,
+		выгрузка базы и т.п.): documents - любая итерируемая последовательность
+		пар (doc_id, text), text - строка unicode. Генератор: документы читаются
+		по одному, для каждого выдаётся (doc_id, stems), stems - список основ
+		значимых слов в порядке текста. Частоты копит TermSpaceAccumulator.
+		Таблица форм ru сохраняется и тогда, когда документы прочитаны не до конца
+		(генератор закрыт через close или удалён).
+		"""
+
+		try:
+			for doc_id, text in documents:
+				if self.stats is None or self.token_cache is None:
+					yield doc_id, list(self.textStems(text))
+				else:
+					hits, misses = self.token_cache.hits, self.token_cache.misses
+					stems = list(self.textStems(text))
+					self.stats.cache_hits += self.token_cache.hits - hits
+					self.stats.cache_misses += self.token_cache.misses - misses
+					yield doc_id, stems
+		finally:
+			self.saveLemmaTable()
+
+
+	def processFile(self, filename):
+		"""
+		Читает файл через DocumentReader, для каждой строки файла вызывает функцию processString.
+		Для tfidf каждое слово из получившегося списка добавляет в set terms_set, избавляясь от
+		дубликатов, и возвращает set уникальных лемм.
+		Для raw возвращает список всех лемм документа.
+		"""
+
+		if self.action == 'tfidf':
+			return set(self.linesStems(self.reader.iterLines(filename)))
+
+		if self.action == 'raw':
+			return list(self.linesStems(self.reader.iterLines(filename)))
+
+
+	def countFile(self, filename, data=None):
+		"""
+		Результат обработки одного документа в том виде, в котором он складывается
+		в общий словарь: set уникальных стемм для tfidf и approx, Counter стемм для raw и tfdf.
+		data - содержимое файла, если оно уже прочитано (см. FilePrefetcher).
+		"""
+
+		if self.ngram_level is not None and self.ngram_level[0] > 1:
+			if self.stats is None:
+				stems = self.documentNgrams(self.reader.iterLines(filename, data), *self.ngram_level)
+			else:
+				start = timeit.default_timer()
+				if self.token_cache is not None:
+					hits, misses = self.token_cache.hits, self.token_cache.misses
+				stems = self.documentNgrams(self.reader.iterLines(filename, data), *self.ngram_level)
+				seconds = timeit.default_timer() - start
+				if self.token_cache is not None:
+					self.stats.cache_hits += self.token_cache.hits - hits
+					self.stats.cache_misses += self.token_cache.misses - misses
+				self.stats.addStage(self.stats.document_stages, 'ngrams', seconds)
+				self.stats.addFile(filename, os.path.getsize(filename), sum(stems.itervalues()), seconds, self.ngram_level[0])
+		elif self.stats is None:
+			stems = self.documentStems(self.reader.iterLines(filename, data))
+		else:
+			start = timeit.default_timer()
+			stems = self.documentStems(self.reader.iterLines(filename, data))
+			self.stats.addFile(filename, os.path.getsize(filename), sum(stems.itervalues()), timeit.default_timer() - start)
+
+		if self.action in ('raw', 'tfdf'):
+			return stems
+
+		return set(stems)
+
+
+	def iterCorpusFiles(self, dirname):
+		"""
+		Проходит по папкам и подпапкам указанной директории и по очереди
+		возвращает пути к текстовым файлам.
+		"""
+
+		for root, dirs, files in walk(dirname):
+
+			print root, "processing..."
+			
+			for filename in files:
+
+				if filename.endswith('.txt') or filename.endswith('.TXT'):
+					
+					print filename
+
+					yield join(root, filename)
+
+
+	def countFiles(self, filenames, workers=1):
+		"""
+		Генератор результатов countFile для файлов filenames в том же порядке.
+		Если workers > 1, файлы раздаются пулу процессов, в каждом из которых один раз
+		создаётся свой BuildTermSpace. Ресурсы языка загружаются до создания пула:
+		при fork процессы получают их уже загруженными (см. sharedResources),
+		иначе каждый процесс загружает их сам, дерево суффиксов - из кэша.
+		С prefetcher файлы читаются заранее потоками основного процесса
+		и процессам пула передаётся уже прочитанное содержимое.
+		"""
+
+		files = ((filename, None) for filename in filenames)
+		# pool.imap забирает задания, не дожидаясь результатов: без ограничения
+		# прочитанные файлы копились бы в очереди пула, поэтому с prefetcher
+		# заданий в пуле не больше depth и каждое - один файл
+		window = threading.Semaphore(sys.maxint)
+		chunksize = 16
+
+		if self.prefetcher is not None:
+			files = self.prefetcher.iterFiles(filenames)
+			window = threading.Semaphore(self.prefetcher.depth)
+			chunksize = 1
+
+		if workers > 1:
+			self.resources.load()
+			pool = multiprocessing.Pool(workers, initWorker, (self.language, self.action, self.cache_size, self.reader, self.lemma_table_path, self.stats is not None, self.ngram_level))
+			stopped = threading.Event()
+			try:
+				for doc_terms, new_lemmas, stats in pool.imap(countFileWorker, iterWindow(files, window, stopped), chunksize):
+					window.release()
+					# формы, которые процесс пула разобрал pymorphy2, попадают в общую таблицу
+					self.lemma_table_ru.update(new_lemmas)
+					self.new_lemmas_ru.update(new_lemmas)
+					if stats is not None:
+						self.stats.merge(stats)
+					yield doc_terms
+			except:
+				# поток пула, ждущий окна, должен дойти до проверки stopped
+				stopped.set()
+				window.release()
+				pool.terminate()
+				raise
+			pool.close()
+			pool.join()
+
+		else:
+			for filename, data in files:
+				yield self.countFile(filename, data)
+
+
+	def finishFiles(self, workers=1):
+		"""
+		Вызывается после countFiles: печатает отчёт о кэше токенов (при workers = 1,
+		у процессов пула свои кэши) и сохраняет таблицу форм ru. Не в конце самого
+		генератора: тот, кто его читает, может не дойти до конца.
+		"""
+
+		if workers <= 1:
+			print "Token cache: %d hits, %d misses" % (self.cache_hits, self.cache_misses)
+
+		self.saveLemmaTable()
+
+
+	def crawl(self, dirname, workers=1):
+		"""
+		Функция проходит по папкам и подпапкам указанной в качестве аргумента директории.
+		Для каждого текстового файла запускает функцию countFile и складывает результат
+		её работы в общий terms_dict.
+		В общем terms_dict подсчитывается частотность каждой леммы, словарь сохраняется как json.
+		terms_dict отражает по сути вторую часть формулы tfidf, т.е. показывает в каком количестве
+		документов встретился термин.
+		Если workers > 1, файлы обрабатываются пулом процессов (см. countFiles), результат
+		совпадает с однопроцессным режимом.
+		С max_terms словарь копится с ограничением памяти (см. TermSpaceAccumulator).
+		С ngram_max > 1 считаются n-граммы (см. crawlNgrams).
+		"""
+
+		if self.ngram_max > 1:
+			return self.crawlNgrams(dirname, workers)
+
+		start = self.profileStart()
+		accumulator = self.newAccumulator()
+
+		try:
+			for doc_terms in self.countFiles(self.iterCorpusFiles(dirname), workers):
+				accumulator.addCounts(doc_terms)
+			self.finishFiles(workers)
+
+			self.dumpAccumulator(accumulator)
+		finally:
+			accumulator.close()
+
+		self.writeProfileReport(timeit.default_timer() - start, workers)
+
+
+	def crawlNgrams(self, dirname, workers=1):
+		"""
+		crawl для n-грамм основ длиной от 1 до ngram_max с порогом min_df: в результат
+		попадают n-граммы не меньше чем из min_df документов (для raw - с частотой
+		не меньше min_df). Корпус проходится ngram_max раз, на проходе n считаются
+		только n-граммы, у которых первые и последние n-1 основ прошли порог
+		на проходе n-1: у остальных документов заведомо меньше. Так отсечение
+		идёт во время подсчёта и в памяти не бывает n-грамм, которые заведомо
+		не пройдут порог, а результат тот же, что при подсчёте всех n-грамм.
+		Результат - в тех же форматах, что для основ, ключи - n-граммы через пробел;
+		max_df и top_k применяются при сохранении. С pmi коллокации всех n-грамм,
+		прошедших min_df, сохраняются ещё и отдельно (см. writeCollocations).
+		Для approx, crawlDocuments и crawlIncremental n-граммы не считаются.
+		prune_terms не поддерживается: заниженная частота (n-1)-граммы может
+		выбросить n-граммы, которые прошли бы порог, и граница ошибки теряется.
+		"""
+
+		if self.action == 'approx':
+			raise ValueError("n-grams are not supported for approx")
+
+		if self.prune_terms is not None:
+			raise ValueError("n-grams are not supported with prune_terms")
+
+		start = self.profileStart()
+
+		# корпус проходится несколько раз
+		filenames = list(self.iterCorpusFiles(dirname))
+		terms_dict = {}
+		frequent = None
+		# для PMI: число документов, для raw - всех вхождений основ
+		total = 0
+
+		try:
+			for n in xrange(1, self.ngram_max + 1):
+
+				self.ngram_level = (n, frequent)
+				accumulator = TermSpaceAccumulator(self.action, self.max_terms, self.tmp_dir)
+
+				try:
+					for doc_terms in self.countFiles(filenames, workers):
+						accumulator.addCounts(doc_terms)
+					self.finishFiles(workers)
+
+					min_df = self.dfLimit(self.min_df, accumulator.docs_num)
+					level = {}
+					for term, value in accumulator.iterSorted():
+						if n == 1 and self.action == 'raw':
+							total += value
+						if self.documentFrequency(value) >= min_df:
+							level[term] = value
+				finally:
+					accumulator.close()
+
+				if self.action != 'raw':
+					total = accumulator.docs_num
+
+				print "%d-grams: %d passed min_df %s" % (n, len(level), self.min_df)
+
+				terms_dict.update(level)
+				frequent = frozenset(level)
+				if not frequent:
+					break
+		finally:
+			self.ngram_level = None
+
+		self.dumpTermSpace(terms_dict, len(filenames))
+
+		if self.pmi:
+			self.writeCollocations(terms_dict, total)
+
+		self.writeProfileReport(timeit.default_timer() - start, workers)
+
+
+	def dfLimit(self, limit, docs_num):
+		"""
+		Порог min_df или max_df в документах: float - доля от docs_num, int - число.
+		"""
+
+		if isinstance(limit, float):
+			return limit * docs_num
+
+		return limit
+
+
+	def pruning(self):
+		"""
+		Задано ли отсечение при сохранении (min_df, max_df, top_k).
+		"""
+
+		return minDfPrunes(self.min_df) or self.max_df is not None or self.top_k is not None
+
+
+	def iterPruned(self, items, docs_num):
+		"""
+		Пары (основа, число) из items в том же порядке без основ, не прошедших
+		min_df и max_df (см. documentFrequency). top_k здесь не учитывается.
+		"""
+
+		min_df = self.dfLimit(self.min_df, docs_num)
+		max_df = self.dfLimit(self.max_df, docs_num) if self.max_df is not None else None
+
+		for term, value in items:
+			df = self.documentFrequency(value)
+			if df >= min_df and (max_df is None or df <= max_df):
+				yield term, value
+
+
+	def topItems(self, items):
+		"""
+		top_k первых пар в порядке частотного списка (по убыванию числа, затем по основе).
+		В памяти - не больше top_k пар.
+		"""
+
+		return heapq.nsmallest(self.top_k, items, key=lambda x:(-x[1], x[0]))
+
+
+	def pruneTerms(self, terms_dict, docs_num):
+		"""
+		terms_dict после отсечения min_df, max_df и top_k (новый словарь) или сам terms_dict без отсечения.
+		"""
+
+		if not self.pruning():
+			return terms_dict
+
+		items = self.iterPruned(terms_dict.iteritems(), docs_num)
+
+		if self.top_k is not None:
+			items = self.topItems(items)
+
+		return dict(items)
+
+
+	def documentFrequency(self, value):
+		"""
+		Число документов по значению из словаря текущего действия, для raw - частота.
+		"""
+
+		if self.action == 'tfdf':
+			return unpackTfDf(value)[1]
+
+		return value
+
+
+	def newAccumulator(self):
+		"""
+		Накопитель частот для текущего действия: ApproxTermCounter для approx,
+		иначе TermSpaceAccumulator.
+		"""
+
+		if self.action == 'approx':
+			return ApproxTermCounter(self.approx_epsilon, self.approx_delta, self.heavy_hitters)
+
+		return TermSpaceAccumulator(self.action, self.max_terms, self.tmp_dir, self.prune_terms)
+
+
+	def crawlDocuments(self, documents):
+		"""
+		То же, что crawl, но для пар (doc_id, text) вместо файлов корпуса (см. processIter).
+		Сохраняет результат и возвращает TermSpaceAccumulator с частотами
+		(если словарь сбрасывался на диск из-за max_terms, полный результат - только в файле).
+		n-граммы здесь не считаются: documents можно пройти только один раз.
+		"""
+
+		if self.ngram_max > 1:
+			raise ValueError("n-grams need several passes over the corpus, use crawl")
+
+		start = self.profileStart()
+		accumulator = self.newAccumulator()
+
+		try:
+			for doc_id, stems in self.processIter(documents):
+				accumulator.addStems(stems)
+
+			self.dumpAccumulator(accumulator)
+		finally:
+			accumulator.close()
+
+		self.writeProfileReport(timeit.default_timer() - start)
+
+		return accumulator
+
+
+	def crawlIncremental(self, dirname, workers=1):
+		"""
+		То же, что crawl, но с манифестом корпуса (CorpusManifest), который хранится
+		рядом с результатом. Обрабатываются только новые и изменённые файлы,
+		вклад удалённых и изменённых файлов вычитается из сохранённых частот.
+		Файл считается неизменённым, если совпали размер и время изменения,
+		а если не совпали - если совпал хэш содержимого.
+		Результат совпадает с полным пересчётом корпуса через crawl.
+		Ограничение max_terms здесь не действует: частоты хранятся в манифесте.
+		Для approx не подходит: из приближённых счётчиков нельзя вычесть документ.
+		"""
+
+		if self.action == 'approx':
+			raise ValueError("incremental build is not supported for approx")
+
+		if self.ngram_max > 1:
+			raise ValueError("incremental build is not supported for n-grams")
+
+		start = self.profileStart()
+		manifest = CorpusManifest(self.language, self.action)
+		manifest.load(self.outputPath('manifest_' + self.action + '.json'))
+
+		seen = set()
+		changed = []
+
+		for filename in self.iterCorpusFiles(dirname):
+
+			relpath = os.path.relpath(filename, dirname)
+			seen.add(relpath)
+
+			stat = os.stat(filename)
+			entry = manifest.files.get(relpath)
+
+			if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+				continue
+
+			digest = fileHash(filename)
+
+			if entry is not None and entry['hash'] == digest:
+				entry['size'] = stat.st_size
+				entry['mtime'] = stat.st_mtime
+				continue
+
+			changed.append((relpath, filename, stat.st_size, stat.st_mtime, digest))
+
+		deleted = [relpath for relpath in manifest.files if relpath not in seen]
+
+		for relpath in deleted:
+			manifest.removeFile(relpath)
+
+		print "Incremental build: %d changed or new, %d deleted files" % (len(changed), len(deleted))
+
+		# результаты всё равно попадают в манифест, генератор проходится до конца,
+		# чтобы закрылся пул процессов
+		results = list(self.countFiles([filename for relpath, filename, size, mtime, digest in changed], workers))
+		self.finishFiles(workers)
+
+		for (relpath, filename, size, mtime, digest), doc_terms in zip(changed, results):
+			manifest.removeFile(relpath)
+			manifest.addFile(relpath, size, mtime, digest, doc_terms)
+
+		manifest.save(self.outputPath('manifest_' + self.action + '.json'))
+
+		self.dumpTermSpace(manifest.terms, len(manifest.files))
+
+		self.writeProfileReport(timeit.default_timer() - start, workers)
+
+
+	def outputPath(self, name):
+		"""
+		Путь к выходному файлу с именем name для текущего языка: в output_dir,
+		если она задана, иначе в .\termSpace\.
+		"""
+
+		if self.output_dir is not None:
+			return join(self.output_dir, self.language.upper() + name)
+
+		return r'.\termSpace\\' + self.language.upper() + name
+
+
+	def dumpTermSpace(self, terms_dict, docs_num):
+		"""
+		Сохраняет результат: для raw - частотный список стемм, для tfidf - json,
+		для tfdf - список стемм с частотой и числом документов (см. writeTfDfList).
+		Порядок записи фиксирован (частотный список - по убыванию частоты, затем
+		по стемме; json - по стемме), чтобы вывод не зависел от порядка обработки файлов.
+		При output_format = 'binary' raw и tfidf пишутся в формате BinaryTermSpace,
+		при output_format = 'shard' - шардом (см. writeShard), шард не отсекается.
+		Остальные форматы - после отсечения min_df, max_df и top_k (см. pruneTerms).
+		"""
+
+		if self.output_format == 'shard':
+			self.writeShard(sorted(terms_dict.iteritems()), docs_num)
+			return
+
+		terms_dict = self.pruneTerms(terms_dict, docs_num)
+
+		if self.action == 'tfdf':
+			if self.output_format == 'binary':
+				raise ValueError("binary format is not supported for tfdf")
+			self.writeTfDfList(sorted(terms_dict.iteritems(), key=lambda x:(-x[1], x[0])))
+			return
+
+		if self.output_format == 'binary':
+			if self.action == 'raw':
+				filename = self.outputPath('frequency_list_stem.tsb')
+			else:
+				filename = self.outputPath("CorpusDict_" + str(docs_num) + ".tsb")
+			BinaryTermSpace.write(filename, terms_dict, docs_num, self.language, self.action)
+			return
+
+		if self.action == 'raw':
+			self.writeFrequencyList(sorted(terms_dict.iteritems(), key=lambda x:(-x[1], x[0])))
+		
+		if self.action == 'tfidf':
+
+			with open(self.outputPath("CorpusDict_" + str(docs_num) + ".json"), 'w') as  outfile:
+				json.dump(terms_dict, outfile, sort_keys=True)
+
+
+	def dumpAccumulator(self, accumulator):
+		"""
+		Сохраняет результат TermSpaceAccumulator. Если он сбрасывал словарь на диск,
+		частотный список и json пишутся потоком из слияния частей, байт в байт
+		как dumpTermSpace; для binary слитый словарь собирается в памяти.
+		min_df и max_df отсекаются в том же потоке, для top_k в памяти
+		держатся только top_k самых частых основ.
+		"""
+
+		docs_num = accumulator.docs_num
+
+		if getattr(accumulator, 'prune_floor', 0):
+			print "Pruned counting: counts may be underestimated by at most %d" % accumulator.prune_floor
+
+		if self.action == 'approx':
+			# частотный список самых частых основ, как для raw
+			items = self.iterPruned(accumulator.iterByFrequency(), docs_num)
+			if self.top_k is not None:
+				items = self.topItems(items)
+			if self.output_format == 'binary':
+				BinaryTermSpace.write(self.outputPath('frequency_list_stem_approx.tsb'), dict(items), docs_num, self.language, self.action)
+			else:
+				self.writeFrequencyList(items, 'frequency_list_stem_approx.txt')
+
+		elif self.output_format == 'shard':
+			self.writeShard(accumulator.iterSorted(), docs_num)
+
+		elif not accumulator.runs:
+			self.dumpTermSpace(accumulator.terms_dict, docs_num)
+
+		elif self.output_format == 'binary':
+			self.dumpTermSpace(dict(self.iterPruned(accumulator.iterSorted(), docs_num)), docs_num)
+
+		elif self.top_k is not None:
+			self.dumpTermSpace(dict(self.topItems(self.iterPruned(accumulator.iterSorted(), docs_num))), docs_num)
+
+		elif self.action == 'raw':
+			self.writeFrequencyList(self.iterPruned(accumulator.iterByFrequency(), docs_num))
+
+		elif self.action == 'tfdf':
+			self.writeTfDfList(self.iterPruned(accumulator.iterByFrequency(), docs_num))
+
+		else:
+			# то же, что json.dump(terms_dict, outfile, sort_keys=True), но по одной паре
+			with open(self.outputPath("CorpusDict_" + str(docs_num) + ".json"), 'w') as outfile:
+				separator = '{'
+				for key, value in self.iterPruned(accumulator.iterSorted(), docs_num):
+					outfile.write(separator + json.dumps(key) + ': ' + str(value))
+					separator = ', '
+				outfile.write('}' if separator == ', ' else '{}')
+
+
+	def writeShard(self, items, docs_num):
+		"""
+		Шард - результат для слияния с результатами по другим частям корпуса
+		(см. mergeShards): первая строка - заголовок json с версией формата и обработки,
+		языком, действием, числом документов, ngram_max и min_df, дальше строки
+		"основа<tab>число" в utf-8 по возрастанию основы, числа - как в TermSpaceAccumulator.
+		items - пары (основа, число) уже в этом порядке.
+		"""
+
+		header = {'format': 'termspace-shard', 'version': SHARD_FORMAT_VERSION, 'pipeline': PIPELINE_VERSION,
+			'language': self.language, 'action': self.action, 'docs_num': docs_num,
+			'ngram_max': self.ngram_max, 'min_df': self.min_df}
+
+		with open(self.outputPath('Shard_' + self.action + '.shard'), 'wb') as outfile:
+			outfile.write(json.dumps(header, sort_keys=True) + b'\n')
+			for term, count in items:
+				outfile.write(term.encode('utf-8') + b'\t' + str(count) + b'\n')
+
+
+	def mergeShards(self, paths):
+		"""
+		Сливает шарды paths (см. TermSpaceShards) и сохраняет результат так же,
+		как crawl: в output_format, в том числе снова шардом для следующего слияния.
+		Шарды должны быть собраны для того же языка и действия, что у этого объекта.
+		"""
+
+		shards = TermSpaceShards(paths, self.max_terms or 1000000, self.tmp_dir)
+
+		try:
+			if shards.language != self.language or shards.action != self.action:
+				raise ValueError("shards are built for %s/%s, not for %s/%s" % (shards.language, shards.action, self.language, self.action))
+			self.ngram_max = shards.ngram_max
+			print "Merging %d shards, %d documents" % (len(paths), shards.docs_num)
+			self.dumpAccumulator(shards)
+		finally:
+			shards.close()
+
+
+	def writeFrequencyList(self, items, name='frequency_list_stem.txt'):
+		"""
+		Частотный список: пары (стемма, частота) в переданном порядке, по строке на пару.
+		"""
+
+		with codecs.open(self.outputPath(name), 'w', 'utf-16') as outfile:
+			for key, value in items:
+				outfile.write(key+'\t'+str(value))
+				outfile.write('\n')
+
+
+	def writeCollocations(self, terms_dict, total):
+		"""
+		Коллокации: строки "n-грамма<tab>PMI<tab>число документов" (для raw - частота)
+		для n-грамм из двух и больше основ, по убыванию PMI, затем по n-грамме.
+		PMI = log2(p(w1...wn) / (p(w1)...p(wn))), p - доля документов с n-граммой
+		или основой из total (для raw - доля вхождений). Основы каждой n-граммы
+		есть в terms_dict: иначе она не прошла бы min_df (см. crawlNgrams).
+		"""
+
+		if total == 0:
+			# пустой корпус: n-грамм нет, список коллокаций пустой
+			self.writeFrequencyList([], 'collocations_pmi.txt')
+			return
+
+		log_total = math.log(total)
+		scores = []
+
+		for gram, value in terms_dict.iteritems():
+			stems = gram.split(' ')
+			if len(stems) < 2:
+				continue
+			count = self.documentFrequency(value)
+			pmi = (math.log(count) + (len(stems) - 1) * log_total - sum(math.log(self.documentFrequency(terms_dict[stem])) for stem in stems)) / math.log(2)
+			scores.append((-pmi, gram, count))
+
+		scores.sort()
+
+		self.writeFrequencyList(((gram, '%.4f\t%d' % (-score, count)) for score, gram, count in scores), 'collocations_pmi.txt')
+
+
+	def writeTfDfList(self, items):
+		"""
+		Список tfdf: строки "стемма<tab>частота<tab>число документов" по убыванию
+		частоты, затем числа документов, затем по стемме. items - пары (стемма, число
+		из TermSpaceAccumulator) уже в этом порядке.
+		"""
+
+		self.writeFrequencyList(((key, '%d\t%d' % unpackTfDf(value)) for key, value in items), 'frequency_list_stem_tfdf.txt')
+
+
+
+def writeRun(items, dirname):
+	"""
+	Записывает пары (основа, частота) во временный файл в папке dirname
+	(строки "основа<tab>частота" в utf-8) и возвращает путь к нему.
+	В основах не бывает табуляций и переводов строк (в n-граммах основы разделены
+	пробелом), так что разделители однозначны.
+	"""
+
+	fd, path = tempfile.mkstemp(suffix='.run', dir=dirname)
+
+	with os.fdopen(fd, 'wb') as outfile:
+		for term, count in items:
+			outfile.write(term.encode('utf-8') + b'\t' + str(count) + b'\n')
+
+	return path
+
+
+def readRun(path):
+	"""
+	Генератор пар (основа, частота) из файла writeRun.
+	"""
+
+	with open(path, 'rb') as infile:
+		for line in infile:
+			term, count = line.rstrip(b'\n').rsplit(b'\t', 1)
+			yield term.decode('utf-8'), int(count)
+
+
+def readShardHeader(path):
+	"""
+	Заголовок шарда (см. BuildTermSpace.writeShard).
+	"""
+
+	with open(path, 'rb') as infile:
+		header = json.loads(infile.readline())
+
+	if header.get('format') != 'termspace-shard' or header.get('version') != SHARD_FORMAT_VERSION:
+		raise ValueError("%s is not a term space shard of version %d" % (path, SHARD_FORMAT_VERSION))
+
+	if header['pipeline'] != PIPELINE_VERSION:
+		raise ValueError("shard %s was built by pipeline version %s, current is %d" % (path, header['pipeline'], PIPELINE_VERSION))
+
+	return header
+
+
+def readShard(path):
+	"""
+	Генератор пар (основа, число) шарда в порядке файла, т.е. по возрастанию основы.
+	"""
+
+	with open(path, 'rb') as infile:
+		infile.readline()
+		for line in infile:
+			term, count = line.rstrip(b'\n').rsplit(b'\t', 1)
+			yield term.decode('utf-8'), int(count)
+
+
+def unpackTfDf(value):
+	"""
+	(частота, число документов) из числа для tfdf (см. TFDF_DOCS_BITS).
+	"""
+
+	return value >> TFDF_DOCS_BITS, value & ((1 << TFDF_DOCS_BITS) - 1)
+
+
+def sumSortedCounts(items):
+	"""
+	Складывает частоты соседних пар с одинаковой основой в отсортированном по основе потоке.
+	"""
+
+	term = None
+	total = 0
+
+	for next_term, count in items:
+		if next_term == term:
+			total += count
+		else:
+			if term is not None:
+				yield term, total
+			term = next_term
+			total = count
+
+	if term is not None:
+		yield term, total
+
+
+def fileHash(filename):
+	"""
+	sha1 содержимого файла, читается блоками.
+	"""
+
+	digest = hashlib.sha1()
+
+	with open(filename, 'rb') as infile:
+		for chunk in iter(lambda: infile.read(1048576), b''):
+			digest.update(chunk)
+
+	return digest.hexdigest()
+
+
+def replaceFile(source, target):
+	"""
+	Переименовывает source в target, заменяя target, если он есть, так что target
+	не пропадает ни в какой момент. В POSIX это делает os.rename, в Windows
+	os.rename существующий файл не заменяет, поэтому - MoveFileExW с MOVEFILE_REPLACE_EXISTING.
+	"""
+
+	if os.name != 'nt':
+		os.rename(source, target)
+		return
+
+	import ctypes
+	# MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH
+	if not ctypes.windll.kernel32.MoveFileExW(unicode(source), unicode(target), 0x1 | 0x8):
+		raise ctypes.WinError()
+
+
+# Общие для процесса ресурсы языков (см. sharedResources).
+shared_resources = {}
+shared_resources_lock = threading.Lock()
+
+
+def sharedResources(language):
+	"""
+	Один LanguageResources на язык в пределах процесса, его получают все BuildTermSpace,
+	которым не передали ресурсы явно. Загружается при первом использовании.
+	"""
+
+	with shared_resources_lock:
+		resources = shared_resources.get(language)
+		if resources is None:
+			resources = shared_resources[language] = LanguageResources(language)
+
+	return resources
+
+
+# Процессы пула при многопроцессном обходе корпуса (BuildTermSpace.crawl с workers > 1).
+# В каждом процессе один раз создаётся свой BuildTermSpace.
+worker_builder = None
+
+
+def initWorker(language, action, cache_size, reader, lemma_table, profile, ngram_level):
+
+	global worker_builder
+	worker_builder = BuildTermSpace(language, action, cache_size, reader, lemma_table=lemma_table)
+	worker_builder.ngram_level = ngram_level
+	# отчёт пишет основной процесс, процессы пула только отдают замеры
+	if profile:
+		worker_builder.stats = PipelineStats()
+
+
+def countFileWorker(args):
+
+	filename, data = args
+	doc_terms = worker_builder.countFile(filename, data)
+
+	return doc_terms, worker_builder.takeNewLemmas(), worker_builder.takeStats()
+
+
+def minDfPrunes(min_df):
+	"""
+	Отсекает ли что-нибудь порог min_df: не отсекает только число 1, доля 1.0 -
+	это 'во всех документах'.
+	"""
+
+	return not (isinstance(min_df, (int, long)) and min_df == 1)
+
+
+def iterWindow(items, window, stopped):
+	"""
+	Выдаёт items, каждый раз занимая место в window (threading.Semaphore),
+	место освобождает тот, кто забрал результат. После stopped ничего не выдаёт.
+	"""
+
+	for item in items:
+		window.acquire()
+		if stopped.is_set():
+			return
+		yield item
+
+
+def parseDf(value):
+	"""
+	Значение --min-df или --max-df: число документов или, если есть точка, доля.
+	"""
+
+	if '.' in value:
+		ratio = float(value)
+		if not 0 < ratio <= 1:
+			raise ValueError('document frequency ratio must be between 0 and 1: ' + value)
+		return ratio
+
+	count = int(value)
+	if count < 1:
+		raise ValueError('document frequency must be positive: ' + value)
+	return count
+
+
+def mergeMain(argv):
+	"""
+	Команда merge: script.py merge shard1 shard2 ... [--format json | binary | shard] [--output-dir path] [--max-terms N]
+	[--min-df N | R] [--max-df N | R] [--top-k N]. Язык и действие берутся из шардов.
+	"""
+
+	usage = 'Usage: [script.py] merge [shard ...] [--format json | binary | shard] [--output-dir path] [--max-terms N] [--min-df N | R] [--max-df N | R] [--top-k N]'
+
+	try:
+		opts, paths = getopt.gnu_getopt(argv, '', ['format=', 'output-dir=', 'max-terms=', 'min-df=', 'max-df=', 'top-k='])
+		options = dict(opts)
+		output_format = options.get('--format', 'json')
+		if output_format not in ('json', 'binary', 'shard'):
+			raise ValueError('unknown --format value: ' + output_format)
+		max_terms = int(options['--max-terms']) if '--max-terms' in options else None
+		if max_terms is not None and max_terms < 1:
+			raise ValueError('--max-terms must be positive')
+		if not paths:
+			raise ValueError('no shards to merge')
+		header = readShardHeader(paths[0])
+		if header['action'] == 'tfdf' and output_format == 'binary':
+			raise ValueError('--format binary is not supported for tfdf')
+		min_df = parseDf(options.get('--min-df', '1'))
+		max_df = parseDf(options['--max-df']) if '--max-df' in options else None
+		top_k = int(options['--top-k']) if '--top-k' in options else None
+		if top_k is not None and top_k < 1:
+			raise ValueError('--top-k must be positive')
+		if output_format == 'shard' and (minDfPrunes(min_df) or max_df is not None or top_k is not None):
+			raise ValueError('--format shard is not supported for pruned results')
+	except (getopt.GetoptError, ValueError, IOError) as err:
+		print '\n', err, '\n'
+		print usage
+		sys.exit(1)
+
+	trms = BuildTermSpace(header['language'], header['action'], output_format=output_format, output_dir=options.get('--output-dir'), max_terms=max_terms, min_df=min_df, max_df=max_df, top_k=top_k)
+
+	try:
+		trms.mergeShards(paths)
+	except ValueError as err:
+		# несовместимые шарды
+		print '\n', err, '\n'
+		sys.exit(1)
+
+
+def main():
+
+	if sys.argv[1:2] == ['merge']:
+		mergeMain(sys.argv[2:])
+		return
+
+	usage = 'Usage: [script.py] [path_to_corpus] [en | de | ru] [tfidf | raw | approx | tfdf] [--workers N] [--cache-size N] [--encodings utf-16,utf-8,cp1251] [--decode-errors replace | ignore | skip | strict] [--mmap] [--incremental] [--format json | binary | shard] [--lemma-table path] [--output-dir path] [--max-terms N] [--approx-epsilon E] [--approx-delta D] [--heavy-hitters N] [--profile report.json] [--ngrams N] [--pmi] [--min-df N | R] [--max-df N | R] [--top-k N] [--prune-terms N] [--prefetch N] [--io-threads N]'
+
+	if len(sys.argv) < 4:
+		print '\n', 'Sctipt requires parameters!','\n'
+		print usage
+		sys.exit(1)
+
+	dir_path = sys.argv[1]
+	language = sys.argv[2]
+	# action = 1) tfidf = count stems for tfidf, 2) raw = count absolute freq. of each stem,
+	# 3) approx = approximate number of documents for the most frequent stems only,
+	# 4) tfdf = absolute freq. and number of documents of each stem in one pass
+	action = sys.argv[3]
+
+	# --workers N = number of processes crawling the corpus
+	# --cache-size N = max number of cached token -> stem results per process, 0 = no cache
+	# --encodings = encodings tried in order when a file has no BOM
+	# --decode-errors = what to do with a file that can't be decoded, see DocumentReader
+	# --mmap = read files through mmap
+	# --incremental = only process files added or changed since the last --incremental run
+	# --format = json (frequency list for raw), binary (see BinaryTermSpace) or shard,
+	#   shards of several corpus parts are combined with: script.py merge shard1 shard2 ...
+	# --lemma-table = ru only: file with saved form -> stem results, loaded at start and updated at the end
+	# --output-dir = directory for the results instead of .\termSpace\
+	# --max-terms N = keep at most N stems in memory while counting, spill the rest to temp files
+	# --approx-epsilon, --approx-delta = approx only: counts are overestimated by at most
+	#   epsilon * (sum of all counts) with probability 1 - delta
+	# --heavy-hitters N = approx only: number of most frequent stems tracked and written
+	# --profile = write per-stage timings, token cache hit rate and per-file throughput to a json report
+	# --ngrams N = count stem n-grams of length 1..N instead of stems, one pass over the corpus per length
+	# --min-df N = keep only stems / n-grams found in at least N documents (raw: at least N times),
+	#   a value with a dot is a ratio of the number of documents (--min-df 0.001)
+	# --max-df N = drop stems found in more than N documents (or ratio, --max-df 0.5)
+	# --top-k N = keep only the N most frequent stems
+	# --prune-terms N = tfidf, raw: keep at most N stems in memory by periodically dropping rare ones,
+	#   counts become approximate (underestimated by at most the reported bound)
+	# --pmi = with --ngrams: also write n-grams scored by pointwise mutual information
+	# --prefetch N = read up to N files ahead in background threads while stems are counted
+	#   (for corpora on network drives), see FilePrefetcher
+	# --io-threads N = with --prefetch: number of threads reading files, default 4
+	try:
+		opts, args = getopt.getopt(sys.argv[4:], '', ['workers=', 'cache-size=', 'encodings=', 'decode-errors=', 'mmap', 'incremental', 'format=', 'lemma-table=', 'output-dir=', 'max-terms=', 'approx-epsilon=', 'approx-delta=', 'heavy-hitters=', 'profile=', 'ngrams=', 'min-df=', 'pmi', 'max-df=', 'top-k=', 'prune-terms=', 'prefetch=', 'io-threads='])
+		options = dict(opts)
+		workers = int(options.get('--workers', 1))
+		cache_size = int(options.get('--cache-size', 100000))
+		reader = DocumentReader(options.get('--encodings', 'utf-16,utf-8,cp1251').split(','), options.get('--decode-errors', 'replace'), use_mmap='--mmap' in options)
+		if reader.errors not in ('replace', 'ignore', 'skip', 'strict'):
+			raise ValueError('unknown --decode-errors value: ' + reader.errors)
+		output_format = options.get('--format', 'json')
+		max_terms = int(options['--max-terms']) if '--max-terms' in options else None
+		if max_terms is not None and max_terms < 1:
+			raise ValueError('--max-terms must be positive')
+		approx_epsilon = float(options.get('--approx-epsilon', 0.00001))
+		approx_delta = float(options.get('--approx-delta', 0.01))
+		heavy_hitters = int(options.get('--heavy-hitters', 10000))
+		if not (0 < approx_epsilon < 1 and 0 < approx_delta < 1) or heavy_hitters < 1:
+			raise ValueError('--approx-epsilon and --approx-delta must be between 0 and 1, --heavy-hitters positive')
+		if action == 'approx' and '--incremental' in options:
+			raise ValueError('--incremental is not supported for approx')
+		ngram_max = int(options.get('--ngrams', 1))
+		if ngram_max < 1:
+			raise ValueError('--ngrams must be positive')
+		if ngram_max > 1 and (action == 'approx' or '--incremental' in options):
+			raise ValueError('--ngrams is not supported for approx and --incremental')
+		if '--pmi' in options and ngram_max < 2:
+			raise ValueError('--pmi needs --ngrams 2 or more')
+		min_df = parseDf(options.get('--min-df', '1'))
+		max_df = parseDf(options['--max-df']) if '--max-df' in options else None
+		top_k = int(options['--top-k']) if '--top-k' in options else None
+		prune_terms = int(options['--prune-terms']) if '--prune-terms' in options else None
+		if (top_k is not None and top_k < 1) or (prune_terms is not None and prune_terms < 2):
+			raise ValueError('--top-k must be positive, --prune-terms at least 2')
+		if prune_terms is not None and (action not in ('tfidf', 'raw') or max_terms is not None or '--incremental' in options or ngram_max > 1):
+			raise ValueError('--prune-terms is supported for tfidf and raw only, without --max-terms, --incremental and --ngrams')
+		if output_format == 'shard' and (action == 'approx' or minDfPrunes(min_df) or max_df is not None or top_k is not None or prune_terms is not None):
+			raise ValueError('--format shard is not supported for approx, pruned or approximate results: they can\'t be merged exactly')
+		if action == 'tfdf' and output_format == 'binary':
+			raise ValueError('--format binary is not supported for tfdf')
+		if output_format not in ('json', 'binary', 'shard'):
+			raise ValueError('unknown --format value: ' + output_format)
+		prefetcher = None
+		if '--prefetch' in options:
+			prefetcher = FilePrefetcher(int(options.get('--io-threads', 4)), int(options['--prefetch']))
+			if prefetcher.depth < 1 or prefetcher.threads < 1:
+				raise ValueError('--prefetch and --io-threads must be positive')
+		elif '--io-threads' in options:
+			raise ValueError('--io-threads needs --prefetch')
+	except (getopt.GetoptError, ValueError) as err:
+		print '\n', err, '\n'
+		print usage
+		sys.exit(1)
+
+	trms = BuildTermSpace(language, action, cache_size, reader, output_format, options.get('--lemma-table'), output_dir=options.get('--output-dir'), max_terms=max_terms, approx_epsilon=approx_epsilon, approx_delta=approx_delta, heavy_hitters=heavy_hitters, profile_report=options.get('--profile'), ngram_max=ngram_max, min_df=min_df, pmi='--pmi' in options, max_df=max_df, top_k=top_k, prune_terms=prune_terms, prefetcher=prefetcher)
 
-	trms = BuildTermSpace(language, action)
-	trms.crawl(dir_path)
+	if '--incremental' in options:
+		trms.crawlIncremental(dir_path, workers)
+	else:
+		trms.crawl(dir_path, workers)
 
 
 if __name__ == '__main__':
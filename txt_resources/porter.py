@@ -344,6 +344,243 @@ class PorterStemmer:
         return self.b[self.k0:self.k+1]
 
 
+# Stateless variant of the same algorithm. All working state (the buffer b
+# and the offsets k and j) lives in local variables of stem(), so a single
+# instance can be shared between threads. The helpers below take the buffer
+# explicitly and read it exactly as the methods of PorterStemmer do,
+# including negative offsets, so the results are identical.
+
+def cons(b, i):
+    """cons(b, i) is TRUE <=> b[i] is a consonant."""
+    ch = b[i]
+    if ch in 'aeiou':
+        return 0
+    if ch == 'y':
+        if i == 0:
+            return 1
+        return not cons(b, i - 1)
+    return 1
+
+def measure(b, j):
+    """measure(b, j) is m() of PorterStemmer: the number of consonant
+    sequences in b[0] ... b[j].
+    """
+    n = 0
+    i = 0
+    while 1:
+        if i > j:
+            return n
+        if not cons(b, i):
+            break
+        i = i + 1
+    i = i + 1
+    while 1:
+        while 1:
+            if i > j:
+                return n
+            if cons(b, i):
+                break
+            i = i + 1
+        i = i + 1
+        n = n + 1
+        while 1:
+            if i > j:
+                return n
+            if not cons(b, i):
+                break
+            i = i + 1
+        i = i + 1
+
+def vowelinstem(b, j):
+    """vowelinstem(b, j) is TRUE <=> b[0] ... b[j] contains a vowel"""
+    for i in range(j + 1):
+        if not cons(b, i):
+            return 1
+    return 0
+
+def doublec(b, j):
+    """doublec(b, j) is TRUE <=> j,(j-1) contain a double consonant."""
+    if j < 1:
+        return 0
+    if b[j] != b[j-1]:
+        return 0
+    return cons(b, j)
+
+def cvc(b, i):
+    """cvc(b, i) is TRUE <=> i-2,i-1,i has the form consonant - vowel - consonant
+    and also if the second c is not w,x or y.
+    """
+    if i < 2 or not cons(b, i) or cons(b, i-1) or not cons(b, i-2):
+        return 0
+    if b[i] in 'wxy':
+        return 0
+    return 1
+
+def ends(b, k, s):
+    """ends(b, k, s) returns j, the offset before the suffix s if b[0] ... b[k]
+    ends with s, and None otherwise.
+    """
+    length = len(s)
+    if s[length - 1] != b[k]:
+        return None
+    if length > k + 1:
+        return None
+    if b[k-length+1:k+1] != s:
+        return None
+    return k - length
+
+def setto(b, j, s):
+    """setto(b, j, s) sets (j+1),...k to the characters in the string s,
+    returning the new buffer and k.
+    """
+    length = len(s)
+    return b[:j+1] + s + b[j+length+1:], j + length
+
+
+# Suffix tables of steps 2, 3 and 4, keyed by the penultimate letter of the
+# word as the switches in PorterStemmer are. Within a key the suffixes are
+# tried in the same order, the first one that matches ends the step.
+
+STEP2_SUFFIXES = {
+    'a': (("ational", "ate"), ("tional", "tion")),
+    'c': (("enci", "ence"), ("anci", "ance")),
+    'e': (("izer", "ize"),),
+    'l': (("bli", "ble"), ("alli", "al"), ("entli", "ent"), ("eli", "e"), ("ousli", "ous")),
+    'o': (("ization", "ize"), ("ation", "ate"), ("ator", "ate")),
+    's': (("alism", "al"), ("iveness", "ive"), ("fulness", "ful"), ("ousness", "ous")),
+    't': (("aliti", "al"), ("iviti", "ive"), ("biliti", "ble")),
+    'g': (("logi", "log"),),
+}
+
+STEP3_SUFFIXES = {
+    'e': (("icate", "ic"), ("ative", ""), ("alize", "al")),
+    'i': (("iciti", "ic"),),
+    'l': (("ical", "ic"), ("ful", "")),
+    's': (("ness", ""),),
+}
+
+# The flag marks suffixes that only match after s or t (-sion, -tion).
+STEP4_SUFFIXES = {
+    'a': (("al", 0),),
+    'c': (("ance", 0), ("ence", 0)),
+    'e': (("er", 0),),
+    'i': (("ic", 0),),
+    'l': (("able", 0), ("ible", 0)),
+    'n': (("ant", 0), ("ement", 0), ("ment", 0), ("ent", 0)),
+    'o': (("ion", 1), ("ou", 0)),
+    's': (("ism", 0),),
+    't': (("ate", 0), ("iti", 0)),
+    'u': (("ous", 0),),
+    'v': (("ive", 0),),
+    'z': (("ize", 0),),
+}
+
+
+class StatelessPorterStemmer:
+
+    def __init__(self, memo_size=0):
+        """stem(word) returns the same stem as PorterStemmer().stem(word, 0,
+        len(word)-1) but never modifies the instance, apart from the optional
+        memo: with memo_size > 0 the stems of up to memo_size words are kept
+        in a dict. The memo only grows until it is full, so concurrent
+        stem() calls at worst compute the same stem twice.
+        """
+
+        self.memo_size = memo_size
+        self.memo = {}
+
+    def stem(self, word):
+        """stem(word) returns the stem of the lower case string word."""
+        if self.memo_size > 0:
+            stem = self.memo.get(word)
+            if stem is None:
+                stem = stemWord(word)
+                if len(self.memo) < self.memo_size:
+                    self.memo[word] = stem
+            return stem
+        return stemWord(word)
+
+
+def stemWord(b):
+    """stemWord(b) runs steps 1ab - 5 of PorterStemmer.stem on the string b,
+    keeping b, k and j in local variables.
+    """
+    k = len(b) - 1
+    if k <= 1:
+        return b # --DEPARTURE-- as in PorterStemmer.stem
+
+    # step1ab
+    if b[k] == 's':
+        if ends(b, k, "sses") is not None:
+            k = k - 2
+        elif ends(b, k, "ies") is not None:
+            b, k = setto(b, k - 3, "i")
+        elif b[k - 1] != 's':
+            k = k - 1
+    j = ends(b, k, "eed")
+    if j is not None:
+        if measure(b, j) > 0:
+            k = k - 1
+    else:
+        j = ends(b, k, "ed")
+        if j is None:
+            j = ends(b, k, "ing")
+        if j is not None and vowelinstem(b, j):
+            k = j
+            for suffix in ("at", "bl", "iz"):
+                j = ends(b, k, suffix)
+                if j is not None:
+                    b, k = setto(b, j, suffix + "e")
+                    break
+            else:
+                if doublec(b, k):
+                    k = k - 1
+                    if b[k] in 'lsz':
+                        k = k + 1
+                elif measure(b, k) == 1 and cvc(b, k):
+                    b, k = setto(b, k, "e")
+
+    # step1c
+    j = ends(b, k, "y")
+    if j is not None and vowelinstem(b, j):
+        b = b[:k] + 'i' + b[k+1:]
+
+    # step2
+    for suffix, replacement in STEP2_SUFFIXES.get(b[k - 1], ()):
+        j = ends(b, k, suffix)
+        if j is not None:
+            if measure(b, j) > 0:
+                b, k = setto(b, j, replacement)
+            break
+
+    # step3
+    for suffix, replacement in STEP3_SUFFIXES.get(b[k], ()):
+        j = ends(b, k, suffix)
+        if j is not None:
+            if measure(b, j) > 0:
+                b, k = setto(b, j, replacement)
+            break
+
+    # step4
+    for suffix, after_st in STEP4_SUFFIXES.get(b[k - 1], ()):
+        j = ends(b, k, suffix)
+        if j is not None and (not after_st or b[j] == 's' or b[j] == 't'):
+            if measure(b, j) > 1:
+                k = j
+            break
+
+    # step5
+    j = k
+    if b[k] == 'e':
+        a = measure(b, j)
+        if a > 1 or (a == 1 and not cvc(b, k-1)):
+            k = k - 1
+    if b[k] == 'l' and doublec(b, k) and measure(b, j) > 1:
+        k = k - 1
+
+    return b[:k+1]
+
+
 # if __name__ == '__main__':
     # p = PorterStemmer()
     # if len(sys.argv) > 1: